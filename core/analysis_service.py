@@ -1,6 +1,6 @@
 import pandas as pd
 import os
-from core.database import get_connection
+from core.database import get_read_connection
 
 class AnalysisService:
     def __init__(self):
@@ -11,7 +11,7 @@ class AnalysisService:
     # ==========================
     def get_all_sales_records(self, customer_filter=None, color_filter=None, grade_filter=None):
         """获取所有销售记录"""
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             query = '''
                 SELECT 
                     customer_name,
@@ -49,7 +49,7 @@ class AnalysisService:
 
     def get_latest_prices(self, customer_filter=None, color_filter=None, grade_filter=None):
         """获取最新价格 - 基于最新销售记录"""
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             query = '''
                 WITH LatestSales AS (
                     SELECT 
@@ -107,7 +107,7 @@ class AnalysisService:
 
     def get_products(self):
         """获取产品列表"""
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             df = pd.read_sql_query('''
                 SELECT DISTINCT 
                     color,
@@ -124,87 +124,51 @@ class AnalysisService:
     def get_statistics(self):
         """统一获取统计信息"""
         stats = {}
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             try:
-                # 唯一主客户 customer_name,finance_id
-                main_customers = pd.read_sql_query('''
-                    SELECT COUNT(*) AS count
-                    FROM (
-                        SELECT DISTINCT customer_name, finance_id
-                        FROM customers
-                        WHERE customer_name IS NOT NULL
-                            AND finance_id IS NOT NULL
-                    ) AS unique_customers
+                # 客户统计：主客户数、总客户数（所有子客户数合）、活跃客户数，一次查询返回
+                customer_summary = pd.read_sql_query('''
+                    SELECT
+                        (SELECT COUNT(*) FROM (
+                            SELECT DISTINCT customer_name, finance_id
+                            FROM customers
+                            WHERE customer_name IS NOT NULL
+                                AND finance_id IS NOT NULL
+                        )) AS main_customers,
+                        (SELECT COUNT(*) FROM (
+                            SELECT DISTINCT customer_name, finance_id, sub_customer_name
+                            FROM customers
+                            WHERE customer_name IS NOT NULL
+                                AND finance_id IS NOT NULL
+                                AND sub_customer_name IS NOT NULL
+                        )) AS sub_customers,
+                        (SELECT COUNT(*) FROM customers WHERE is_active = 1) AS active_customers
                 ''', conn)
-                stats['main_customers'] = main_customers.iloc[0]['count'] if not main_customers.empty else 0
+                for key, value in customer_summary.iloc[0].to_dict().items():
+                    stats[key] = int(value) if pd.notna(value) else 0
 
-
-                # 总客户数（所有子客户数合）
-                sub_customers = pd.read_sql_query('''
-                    SELECT COUNT(*) AS count
-                    FROM (
-                        SELECT DISTINCT customer_name, finance_id, sub_customer_name
-                        FROM customers
-                        WHERE customer_name IS NOT NULL
-                            AND finance_id IS NOT NULL
-                            AND sub_customer_name IS NOT NULL
-                    ) AS unique_customers
-                ''', conn)
-                stats['sub_customers'] = sub_customers.iloc[0]['count'] if not sub_customers.empty else 0
-
-
-                # 活跃客户数
-                active_customers = pd.read_sql_query('SELECT COUNT(*) AS count FROM customers WHERE is_active = 1', conn)
-                stats['active_customers'] = active_customers.iloc[0]['count'] if not active_customers.empty else 0
-
-                # 唯一颜色数（非空）
-                unique_colors = pd.read_sql_query('''
-                    SELECT COUNT(DISTINCT color) AS count
-                    FROM sales_records
-                     WHERE color IS NOT NULL AND color != ''
-                ''', conn)
-                stats['unique_colors'] = unique_colors.iloc[0]['count'] if not unique_colors.empty else 0
-
-                # 唯一产品数（非空）
-                unique_products = pd.read_sql_query('''
-                    SELECT COUNT(DISTINCT product_name) AS count
-                    FROM sales_records
-                    -- WHERE product_name IS NOT NULL AND product_name != ''
-                ''', conn)
-                stats['unique_products'] = unique_products.iloc[0]['count'] if not unique_products.empty else 0
-
-                # 唯一等级
-                stats['unique_grades'] = pd.read_sql_query(
-                    "SELECT COUNT(DISTINCT grade) AS c FROM sales_records "
-                    "-- WHERE grade != ''",
-                    conn
-                )['c'][0]
-
-                # 最高价
-                stats['max_price'] = pd.read_sql_query(
-                    "SELECT MAX(unit_price) AS m FROM sales_records ",
-                    conn
-                )['m'][0]
-
-                # 最低价
-                stats['min_price'] = pd.read_sql_query(
-                    "SELECT MIN(unit_price) AS m FROM sales_records WHERE unit_price > 0",
-                    conn
-                )['m'][0]
-
-                # 销售汇总
+                # 销售统计：颜色/产品/等级种类、价格区间与销售汇总，一次扫描销售表
+                # 销售汇总只统计单价大于0的记录
                 sales_summary = pd.read_sql_query('''
-                    SELECT 
-                        COUNT(*) AS total_records,
-                        SUM(quantity) AS total_quantity,
-                        SUM(amount) AS total_amount,
-                        AVG(unit_price) AS avg_price
+                    SELECT
+                        COUNT(DISTINCT NULLIF(color, '')) AS unique_colors,
+                        COUNT(DISTINCT product_name) AS unique_products,
+                        COUNT(DISTINCT grade) AS unique_grades,
+                        MAX(unit_price) AS max_price,
+                        MIN(CASE WHEN unit_price > 0 THEN unit_price END) AS min_price,
+                        SUM(unit_price > 0) AS total_records,
+                        SUM(CASE WHEN unit_price > 0 THEN quantity END) AS total_quantity,
+                        SUM(CASE WHEN unit_price > 0 THEN amount END) AS total_amount,
+                        AVG(CASE WHEN unit_price > 0 THEN unit_price END) AS avg_price
                     FROM sales_records
-                    WHERE unit_price > 0
                 ''', conn)
-                if not sales_summary.empty:
-                    for key, value in sales_summary.iloc[0].to_dict().items():
-                        stats[key] = float(value) if pd.notna(value) else 0
+                summary = sales_summary.iloc[0].to_dict()
+                for key in ['unique_colors', 'unique_products', 'unique_grades']:
+                    stats[key] = int(summary[key]) if pd.notna(summary[key]) else 0
+                stats['max_price'] = summary['max_price']
+                stats['min_price'] = summary['min_price']
+                for key in ['total_records', 'total_quantity', 'total_amount', 'avg_price']:
+                    stats[key] = float(summary[key]) if pd.notna(summary[key]) else 0
 
                 # 数据库大小
                 try:
@@ -225,7 +189,7 @@ class AnalysisService:
 
     def get_price_trend(self, finance_id, color, grade=None, sub_customer_name=None):
         """获取价格趋势"""
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             query = '''
                 SELECT 
                     strftime('%Y-%m', record_date) as month,
@@ -265,7 +229,7 @@ class AnalysisService:
         if df.empty:
             return df
         numeric_columns = ['unit_price', 'quantity', 'amount', 'avg_price', 'total_quantity', 'total_amount']
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).round(2)
+        numeric_columns = [col for col in numeric_columns if col in df.columns]
+        if numeric_columns:
+            df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce').fillna(0).round(2)
         return df
@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from core.database import get_connection, get_all_debt_data
+from core.database import get_read_connection, get_all_debt_data
 from datetime import datetime, timedelta
 
 class SalesDebtIntegrationService:
@@ -19,7 +19,7 @@ class SalesDebtIntegrationService:
         
         # 2. 获取所有销售数据 - 按财务编号分组汇总
         sales_df = pd.DataFrame()
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             # 获取所有销售数据，按财务编号、客户名称、部门分组
             sales_query = '''
                 SELECT 
@@ -52,21 +52,13 @@ class SalesDebtIntegrationService:
                 current_date = pd.Timestamp.now()
                 sales_df['days_since_last_sale'] = (current_date - sales_df['last_sale_date']).dt.days
                 
-                def classify_activity(days):
-                    if pd.isna(days):
-                        return '无销售记录'
-                    elif days <= 30:
-                        return '活跃客户(30天内)'
-                    elif days <= 90:
-                        return '一般活跃(90天内)'
-                    elif days <= 180:
-                        return '低活跃(180天内)'
-                    elif days <= 365:
-                        return '休眠客户(1年内)'
-                    else:
-                        return '无销售记录'  # 统一为无销售记录
-                
-                sales_df['销售活跃度'] = sales_df['days_since_last_sale'].apply(classify_activity)
+                # 按距上次销售天数批量分类，缺失日期和超过一年的均归为无销售记录
+                days = sales_df['days_since_last_sale']
+                sales_df['销售活跃度'] = np.select(
+                    [days <= 30, days <= 90, days <= 180, days <= 365],
+                    ['活跃客户(30天内)', '一般活跃(90天内)', '低活跃(180天内)', '休眠客户(1年内)'],
+                    default='无销售记录'
+                )
                 
                 # 获取年度销售数据
                 year_sales_query = f'''
@@ -387,9 +379,11 @@ class SalesDebtIntegrationService:
         
         # 计算欠销比（使用对应年份的销售额和欠款）
         year_sales_column = f'20{current_year}销售额'
-        merged_df['欠销比'] = merged_df.apply(
-            lambda row: (row[year_debt_column] / row[year_sales_column] * 100) if row[year_sales_column] > 0 else 0,
-            axis=1
+        year_sales = merged_df[year_sales_column]
+        merged_df['欠销比'] = np.where(
+            year_sales > 0,
+            merged_df[year_debt_column] / year_sales.where(year_sales > 0) * 100,
+            0
         )
         
         # 客户分类和风险评分（优化版）
@@ -541,7 +535,7 @@ class SalesDebtIntegrationService:
         
         search_term = str(search_term).strip()
         
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             # 先尝试财务编号搜索
             finance_search = '''
                 SELECT 
@@ -1,9 +1,11 @@
 import sqlite3
 import os
 import pandas as pd
+import numpy as np
 from contextlib import contextmanager
 import logging
 import hashlib
+import queue
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -17,10 +19,9 @@ DB_CONFIG = {
     'check_same_thread': False
 }
 
-@contextmanager
-def get_connection():
-    """数据库连接上下文管理器"""
-    conn = sqlite3.connect(**DB_CONFIG)
+def _open_connection(cached_statements=128):
+    """创建数据库连接并应用性能设置"""
+    conn = sqlite3.connect(**DB_CONFIG, cached_statements=cached_statements)
     conn.row_factory = sqlite3.Row
     # 性能优化设置
     conn.execute("PRAGMA journal_mode=WAL")  # 写前日志，提高并发
@@ -28,6 +29,12 @@ def get_connection():
     conn.execute("PRAGMA cache_size=-64000")  # 增加缓存大小
     conn.execute("PRAGMA temp_store=MEMORY")  # 临时表存储在内存
     conn.execute("PRAGMA mmap_size=268435456")  # 256MB内存映射
+    return conn
+
+@contextmanager
+def get_connection():
+    """数据库连接上下文管理器"""
+    conn = _open_connection()
     
     try:
         yield conn
@@ -39,6 +46,61 @@ def get_connection():
     finally:
         conn.close()
 
+# 只读查询连接池：每次查询独占一个连接，WAL 模式下多个会话可并行读取；用完归还复用，避免反复打开连接
+READ_POOL_SIZE = 4
+_read_pool = queue.LifoQueue(maxsize=READ_POOL_SIZE)
+_read_pool_generation = 0
+
+def _open_read_connection():
+    # 读连接服务所有页面的查询，加大预编译语句缓存，重复查询按SQL文本直接复用
+    return _open_connection(cached_statements=512)
+
+def _release_read_connection(conn, generation):
+    """归还读连接；连接池已重置或已满时直接关闭"""
+    if generation != _read_pool_generation:
+        conn.close()
+        return
+    try:
+        _read_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def get_read_connection():
+    """只读查询连接上下文管理器（从连接池取用连接，不提交事务）"""
+    generation = _read_pool_generation
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_read_connection()
+    try:
+        yield conn
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"数据库查询失败: {e}")
+        raise
+    finally:
+        _release_read_connection(conn, generation)
+
+def reset_read_connection():
+    """关闭连接池中的读连接（数据库文件被替换后调用，使用中的连接归还时关闭）"""
+    global _read_pool_generation
+    _read_pool_generation += 1
+    while True:
+        try:
+            _read_pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+def query_df(conn, query, params=()):
+    """执行查询并直接构造DataFrame（统计类小结果集，省去 read_sql_query 的封装开销）"""
+    cursor = conn.cursor()
+    # 返回普通元组，避免 sqlite3.Row 对象的额外转换
+    cursor.row_factory = None
+    cursor.execute(query, params)
+    columns = [desc[0] for desc in cursor.description]
+    return pd.DataFrame(cursor.fetchall(), columns=columns)
+
 def init_database():
     """初始化数据库"""
     with get_connection() as conn:
@@ -133,6 +195,18 @@ def init_database():
                 created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 last_login TIMESTAMP
             )
+            ''',
+            # 销售月度汇总表（按月份+部门预聚合，导入数据时重建）
+            '''
+            CREATE TABLE IF NOT EXISTS sales_monthly_summary (
+                month TEXT,
+                department TEXT,
+                transaction_count INTEGER,
+                total_amount REAL,
+                total_quantity NUMERIC,
+                price_sum REAL,
+                price_count INTEGER
+            )
             '''
         ]
         
@@ -156,8 +230,15 @@ def init_database():
             'CREATE INDEX IF NOT EXISTS idx_customer_finance ON customers(finance_id)',
             'CREATE INDEX IF NOT EXISTS idx_production_line ON sales_records(production_line)',
             'CREATE INDEX IF NOT EXISTS idx_production_line_date ON sales_records(production_line, record_date)',
-            'CREATE INDEX IF NOT EXISTS idx_department ON sales_records(department)',  # 新增部门索引
             'CREATE INDEX IF NOT EXISTS idx_department_date ON sales_records(department, record_date)',  # 新增部门+日期索引
+            # 部门视图覆盖索引：按部门定位后直接在索引内分组聚合，无需回表
+            # （生产线汇总用前者；部门热销产品在全部年份下用后者，按年份过滤时优化器改用 idx_department_date）
+            'CREATE INDEX IF NOT EXISTS idx_sales_department_line ON sales_records(department, production_line, record_date, amount, quantity, unit_price)',
+            'CREATE INDEX IF NOT EXISTS idx_sales_department_product ON sales_records(department, product_name, color, record_date, unit_price, quantity, amount)',
+            # 按部门列出客户及销售额（价格趋势页客户选择）
+            'CREATE INDEX IF NOT EXISTS idx_sales_department_customer ON sales_records(department, customer_name, finance_id, amount)',
+            # 价格趋势页按客户+部门+产品+颜色定位，订单明细可直接按索引日期顺序输出
+            'CREATE INDEX IF NOT EXISTS idx_sales_finance_product ON sales_records(finance_id, department, product_name, color, record_date)',
             # 欠款数据索引
             'CREATE INDEX IF NOT EXISTS idx_debt_finance_id ON unified_debt(finance_id)',
             'CREATE INDEX IF NOT EXISTS idx_debt_department ON unified_debt(department)',
@@ -174,10 +255,25 @@ def init_database():
             except Exception as e:
                 logger.error(f"创建索引 {i+1} 时出错: {e}")
         
+        # 删除已被复合索引前缀覆盖的冗余索引，减少写入时的索引维护开销
+        obsolete_indexes = [
+            'idx_department',  # 被 idx_department_date 覆盖
+        ]
+        for index_name in obsolete_indexes:
+            try:
+                cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
+            except Exception as e:
+                logger.error(f"删除索引 {index_name} 时出错: {e}")
+        
         # 检查并添加必要的列（修复检查逻辑）
         _check_and_alter_tables(cursor)
         # 创建默认用户
         _create_default_users(cursor)
+        # 已有销售数据但汇总表为空时（如旧版本数据库），补建月度汇总
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM sales_monthly_summary)")
+        if not cursor.fetchone()[0]:
+            refresh_sales_summary(cursor)
+            analyze_sales_tables(cursor)
         
         logger.info("数据库初始化完成")
 
@@ -235,6 +331,32 @@ def _check_and_alter_tables(cursor):
         import traceback
         logger.error(f"详细错误: {traceback.format_exc()}")
 
+def analyze_sales_tables(cursor):
+    """数据变更后完整执行 ANALYZE，使查询优化器按实际数据分布选择索引"""
+    try:
+        cursor.execute("ANALYZE")
+        logger.info("已更新查询优化器统计信息")
+    except Exception as e:
+        logger.warning(f"更新统计信息失败: {e}")
+
+def refresh_sales_summary(cursor):
+    """重建销售月度汇总表（在导入数据的同一事务内调用）"""
+    cursor.execute('DELETE FROM sales_monthly_summary')
+    cursor.execute('''
+        INSERT INTO sales_monthly_summary
+        (month, department, transaction_count, total_amount, total_quantity, price_sum, price_count)
+        SELECT
+            strftime('%Y-%m', record_date),
+            COALESCE(department, ''),
+            COUNT(*),
+            SUM(amount),
+            SUM(quantity),
+            SUM(unit_price),
+            COUNT(unit_price)
+        FROM sales_records
+        GROUP BY strftime('%Y-%m', record_date), COALESCE(department, '')
+    ''')
+
 def _create_default_users(cursor):
     """创建默认用户"""
     default_users = [
@@ -420,6 +542,22 @@ def get_database_status(days_threshold=30):
     
     return status
 
+def get_data_version():
+    """获取销售数据版本标识（记录数、最大ID、最新日期），用作页面缓存键"""
+    try:
+        with get_read_connection() as conn:
+            # 分别用子查询取值，MAX 可直接走主键/索引端点，避免合并聚合退化为全表扫描
+            row = conn.execute('''
+                SELECT
+                    (SELECT COUNT(*) FROM sales_records),
+                    (SELECT MAX(id) FROM sales_records),
+                    (SELECT MAX(record_date) FROM sales_records)
+            ''').fetchone()
+            return tuple(row)
+    except Exception as e:
+        logger.warning(f"获取数据版本失败: {e}")
+        return None
+
 def optimize_database():
     """优化数据库"""
     with get_connection() as conn:
@@ -436,6 +574,7 @@ def clear_database():
         cursor.execute("PRAGMA foreign_keys=OFF")
         cursor.execute('DELETE FROM price_change_history')
         cursor.execute('DELETE FROM sales_records')
+        cursor.execute('DELETE FROM sales_monthly_summary')
         cursor.execute('DELETE FROM customers')
         cursor.execute('DELETE FROM unified_debt')
         # 保留users表，但清空非默认用户
@@ -444,25 +583,18 @@ def clear_database():
         cursor.execute("PRAGMA foreign_keys=ON")
     logger.info("数据库已清空")
 
-def batch_insert_sales_records(records):
-    """批量插入销售记录"""
-    if not records:
-        return
-    
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.executemany('''
-                INSERT INTO sales_records 
-                (customer_name, finance_id, sub_customer_name, year, month, day, 
-                 product_name, color, grade, quantity, unit_price, amount, 
-                 ticket_number, remark, production_line, record_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', records)
-            logger.info(f"批量插入了 {len(records)} 条销售记录")
-        except Exception as e:
-            logger.error(f"批量插入失败: {e}")
-            raise
+def restore_database(backup_path):
+    """从备份文件恢复数据库（经 SQLite 备份接口整库写入，旧 WAL 内容不会混入恢复后的数据）"""
+    # 先关闭池中的读连接，使用中的连接归还时也会关闭，恢复后重新打开
+    reset_read_connection()
+    source = sqlite3.connect(backup_path)
+    try:
+        with get_connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            source.backup(conn)
+    finally:
+        source.close()
+    logger.info("数据库已从备份恢复")
 
 def import_debt_data(df, department):
     """导入欠款数据到统一欠款表"""
@@ -572,19 +704,13 @@ def get_sales_by_finance_id_and_name():
             current_date = pd.Timestamp.now()
             df['days_since_last_sale'] = (current_date - df['last_sale_date']).dt.days
             
-            def classify_activity(days):
-                if pd.isna(days):
-                    return '无销售记录'
-                elif days <= 30:
-                    return '活跃(30天内)'
-                elif days <= 90:
-                    return '一般活跃(90天内)'
-                elif days <= 180:
-                    return '低活跃(180天内)'
-                else:
-                    return '休眠客户'
-            
-            df['销售活跃度'] = df['days_since_last_sale'].apply(classify_activity)
+            # 按距上次销售天数批量分类，缺失日期优先归为无销售记录
+            days = df['days_since_last_sale']
+            df['销售活跃度'] = np.select(
+                [days.isna(), days <= 30, days <= 90, days <= 180],
+                ['无销售记录', '活跃(30天内)', '一般活跃(90天内)', '低活跃(180天内)'],
+                default='休眠客户'
+            )
         
         return df
 
@@ -403,7 +403,7 @@ class ImportService:
     
     def _update_import_to_database(self, df: pd.DataFrame, user: str) -> Tuple[bool, str]:
         """更新模式：覆盖重复数据，插入新数据"""
-        from core.database import get_connection
+        from core.database import get_connection, refresh_sales_summary, analyze_sales_tables
         
         with get_connection() as conn:
             try:
@@ -483,6 +483,11 @@ class ImportService:
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     ''', all_records)
                 
+                # 重建月度汇总表，供统计页面直接读取
+                refresh_sales_summary(cursor)
+                # 导入后数据分布已变化，更新优化器统计信息
+                analyze_sales_tables(cursor)
+                
                 # 获取统计信息
                 stats = self._get_import_statistics(
                     df, len(customer_tuples), len(new_records), len(update_records)
@@ -537,7 +542,7 @@ class ImportService:
     
     def _batch_import_new_data(self, df: pd.DataFrame, user: str) -> Tuple[bool, str]:
         """批量导入新数据（基础导入方法）"""
-        from core.database import get_connection
+        from core.database import get_connection, refresh_sales_summary, analyze_sales_tables
         
         with get_connection() as conn:
             try:
@@ -595,6 +600,11 @@ class ImportService:
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     ''', sales_records)
                 
+                # 重建月度汇总表，供统计页面直接读取
+                refresh_sales_summary(cursor)
+                # 导入后数据分布已变化，更新优化器统计信息
+                analyze_sales_tables(cursor)
+                
                 # 获取统计信息
                 stats = self._get_import_statistics(df, len(customer_tuples), len(sales_records), 0)
                 
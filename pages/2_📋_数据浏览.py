@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from core.database import get_connection, get_database_status
+from core.database import get_read_connection, get_database_status
 from utils.auth import require_login
 
 st.logo(
@@ -16,9 +16,9 @@ require_login()
 # 获取所有表的数据
 def get_table_data(table_name):
     """获取指定表的所有数据"""
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         try:
-            df = pd.read_sql_query(f"SELECT * FROM {table_name} ORDER BY id", conn)
+            df = pd.read_sql_query(f"SELECT * FROM {table_name} ORDER BY rowid", conn)
             return df
         except Exception as e:
             st.error(f"读取表 {table_name} 时出错: {str(e)}")
@@ -27,7 +27,7 @@ def get_table_data(table_name):
 # 获取表记录数
 def get_table_count(table_name):
     """获取表的记录数"""
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         try:
             count = pd.read_sql_query(f"SELECT COUNT(*) as count FROM {table_name}", conn).iloc[0]['count']
             return count
@@ -38,7 +38,7 @@ def get_table_count(table_name):
 # 获取所有表名
 def get_table_names():
     """获取数据库中的所有表名"""
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         try:
             tables = pd.read_sql_query("""
                 SELECT name FROM sqlite_master 
@@ -56,7 +56,7 @@ db_status = get_database_status()
 # 获取表的列信息
 def get_table_columns(table_name):
     """获取表的列信息"""
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         try:
             columns = pd.read_sql_query(f"PRAGMA table_info({table_name})", conn)
             return columns
@@ -2,8 +2,9 @@ import streamlit as st
 import pandas as pd
 import math
 from datetime import datetime, timedelta
-from core.database import get_connection
+from core.database import get_read_connection
 from utils.auth import require_login
+from utils.file_utils import dataframe_to_csv_bytes
 
 # ==============================
 # ⚙️ 页面配置
@@ -25,9 +26,10 @@ CACHE_TTL = 600  # 缓存时间（秒）
 # ==============================
 def format_numeric_columns(df, cols):
     """统一格式化数值列"""
-    for col in cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).round(2)
+    cols = [col for col in cols if col in df.columns]
+    if cols:
+        # 一次性转换、填充并取整，避免逐列重复赋值
+        df[cols] = df[cols].apply(pd.to_numeric, errors='coerce').fillna(0).round(2)
     return df
 
 
@@ -36,7 +38,7 @@ def format_numeric_columns(df, cols):
 # ==============================
 @st.cache_data(ttl=CACHE_TTL)
 def get_date_range():
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         res = pd.read_sql_query(
             "SELECT MIN(record_date) AS min_date, MAX(record_date) AS max_date FROM sales_records WHERE record_date IS NOT NULL",
             conn
@@ -48,7 +50,7 @@ def get_date_range():
 
 @st.cache_data(ttl=CACHE_TTL)
 def get_latest_prices():
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         df = pd.read_sql_query("""
             WITH Latest AS (
                 SELECT *,
@@ -86,7 +88,7 @@ def get_unique_values(column):
             CASE WHEN {column} IS NULL OR {column} = '' THEN '(空)' ELSE {column} END AS val
         FROM sales_records ORDER BY val
     """
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         df = pd.read_sql_query(query, conn)
     return df['val'].tolist()
 
@@ -162,7 +164,7 @@ def query_sales_records(filters):
         query += " AND " + " AND ".join(conditions)
     query += " ORDER BY record_date DESC, customer_name, color"
 
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         df = pd.read_sql_query(query, conn, params=params)
         return format_numeric_columns(df, ['数量', '单价', '金额'])
 
@@ -287,8 +289,8 @@ def render_results(df):
 
     render_pagination_controls(current_page, total_pages, len(df), df)
 
-    csv_data = df.to_csv(index=False, encoding='utf-8-sig')
-    st.download_button("📥 导出查询结果", csv_data, "销售记录查询结果.csv", 
+    # 点击下载时才生成CSV，分页、筛选等重跑不再重复序列化
+    st.download_button("📥 导出查询结果", lambda: dataframe_to_csv_bytes(df), "销售记录查询结果.csv", 
                       "text/csv", width='stretch', key="export_filtered")
 
 
@@ -314,8 +316,7 @@ def main():
     with col1: 
         st.caption(f"共 {len(latest_df):,} 条记录")
     with col2: 
-        csv_data = latest_df.to_csv(index=False, encoding='utf-8-sig') 
-        st.download_button("📥 导出最新价格数据", csv_data, "最新价格数据.csv", 
+        st.download_button("📥 导出最新价格数据", lambda: dataframe_to_csv_bytes(latest_df), "最新价格数据.csv", 
                           "text/csv", width='stretch', key="export_latest")
 
     filters = render_filters()
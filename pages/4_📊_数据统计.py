@@ -1,8 +1,9 @@
 import streamlit as st
 import pandas as pd
 from streamlit_echarts import st_echarts
-from core.database import get_connection
+from core.database import get_read_connection, get_data_version, query_df
 from utils.auth import require_login
+from utils.file_utils import dataframe_to_csv_bytes
 
 # 页面配置
 st.logo(
@@ -21,6 +22,9 @@ st.title("📊 数据统计分析仪表板")
 
 require_login()
 
+# 数据版本标识作为缓存键的一部分，导入新数据后缓存自动失效
+data_version = get_data_version()
+
 # 现代商业配色方案
 COLOR_SCHEME = {
     'primary': ['#4f46e5', '#7c3aed', '#a855f7', '#d946ef'],  # 紫色系
@@ -31,69 +35,54 @@ COLOR_SCHEME = {
     'sequential': ['#3b82f6', '#60a5fa', '#93c5fd', '#bfdbfe']  # 蓝色渐变
 }
 
+# 月份序号到中文月份名称的映射
+CHINESE_MONTH_NAMES = {
+    1: '一月', 2: '二月', 3: '三月', 4: '四月', 5: '五月', 6: '六月',
+    7: '七月', 8: '八月', 9: '九月', 10: '十月', 11: '十一月', 12: '十二月'
+}
+
 # ==================== 优化的缓存函数 ====================
+def downcast_count_columns(df, columns):
+    """计数列转换为最小可用整数类型，减少缓存占用和图表序列化体积（金额列保持float64精度）"""
+    for col in columns:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+def year_date_range(year_filter):
+    """年份转换为 [当年1月1日, 次年1月1日) 日期区间，查询可直接走 record_date 索引范围扫描"""
+    year = int(year_filter)
+    return f"{year}-01-01", f"{year + 1}-01-01"
+
 @st.cache_data(ttl=300)
-def get_available_years():
+def get_available_years(data_version=None):
     """获取数据中存在的年份列表"""
     try:
-        with get_connection() as conn:
-            df = pd.read_sql_query('''
-                SELECT year
-                FROM (
-                    SELECT DISTINCT CAST(strftime('%Y', record_date) as INTEGER) as year
-                    FROM sales_records
-                    WHERE record_date IS NOT NULL
-                    AND record_date != ''
-                )
+        with get_read_connection() as conn:
+            # 年份直接取自月度汇总表，无需逐行解析销售明细的日期
+            df = query_df(conn, '''
+                SELECT DISTINCT CAST(substr(month, 1, 4) as INTEGER) as year
+                FROM sales_monthly_summary
+                WHERE month IS NOT NULL AND month != ''
                 ORDER BY year DESC
-            ''', conn)
+            ''')
         years = df['year'].dropna().astype(int).tolist()
         return ['全部年份'] + [str(year) for year in years]
     except Exception as e:
         st.error(f"获取年份列表失败: {str(e)}")
         return ['全部年份']
 
-@st.cache_data(ttl=300)
-def get_department_list(year_filter):
-    """获取部门列表"""
-    try:
-        with get_connection() as conn:
-            if year_filter != "全部年份":
-                query = '''
-                    SELECT DISTINCT department
-                    FROM sales_records
-                    WHERE strftime('%Y', record_date) = ? 
-                        AND department IS NOT NULL 
-                        AND department != ''
-                    ORDER BY department
-                '''
-                params = [year_filter]
-            else:
-                query = '''
-                    SELECT DISTINCT department
-                    FROM sales_records
-                    WHERE department IS NOT NULL AND department != ''
-                    ORDER BY department
-                '''
-                params = []
-            
-            dept_list = pd.read_sql_query(query, conn, params=params)
-            return dept_list['department'].tolist() if not dept_list.empty else []
-    except Exception as e:
-        st.error(f"获取部门列表失败: {str(e)}")
-        return []
-
 @st.cache_data(ttl=300, show_spinner="正在加载统计数据...")
-def get_cached_total_stats(year_filter):
+def get_cached_total_stats(year_filter, data_version=None):
     """缓存总数统计数据"""
     try:
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             year_condition = ""
             params = []
             
             if year_filter != "全部年份":
-                year_condition = "WHERE strftime('%Y', record_date) = ?"
-                params = [year_filter]
+                year_condition = "WHERE record_date >= ? AND record_date < ?"
+                params = list(year_date_range(year_filter))
             
             # 使用单个查询获取所有统计数据
             base_query = f'''
@@ -114,7 +103,7 @@ def get_cached_total_stats(year_filter):
                 {year_condition}
             '''
             
-            stats_df = pd.read_sql_query(base_query, conn, params=params)
+            stats_df = query_df(conn, base_query, params)
             
             if stats_df.empty:
                 return get_default_stats()
@@ -157,53 +146,65 @@ def get_default_stats():
     }
 
 @st.cache_data(ttl=300)
-def get_cached_department_stats(year_filter):
+def get_cached_department_stats(year_filter, data_version=None):
     """缓存部门统计数据"""
     try:
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             year_condition = ""
             params = []
             if year_filter != "全部年份":
-                year_condition = "WHERE strftime('%Y', record_date) = ?"
+                year_condition = "WHERE substr(month, 1, 4) = ?"
                 params = [year_filter]
             
+            # 从月度汇总表聚合，无需扫描销售明细
             dept_stats_query = f'''
                 SELECT 
                     COALESCE(NULLIF(department, ''), '未分类') as department,
-                    COUNT(*) as record_count,
-                    ROUND(SUM(amount), 2) as total_amount,
-                    SUM(quantity) as total_quantity,
-                    ROUND(AVG(unit_price), 2) as avg_price
-                FROM sales_records
+                    SUM(transaction_count) as record_count,
+                    ROUND(SUM(total_amount), 2) as total_amount,
+                    SUM(total_quantity) as total_quantity,
+                    ROUND(SUM(price_sum) / SUM(price_count), 2) as avg_price
+                FROM sales_monthly_summary
                 {year_condition}
                 GROUP BY COALESCE(NULLIF(department, ''), '未分类')
                 ORDER BY total_amount DESC
             '''
-            dept_stats = pd.read_sql_query(dept_stats_query, conn, params=params)
+            dept_stats = query_df(conn, dept_stats_query, params)
+            
+            # 未分类掩码只计算一次，已分类/未分类记录数直接由总数相减得到
+            unclassified_mask = dept_stats['department'] == '未分类'
+            total_records = int(dept_stats['record_count'].sum()) if not dept_stats.empty else 0
+            unclassified_records = int(dept_stats.loc[unclassified_mask, 'record_count'].sum()) if not dept_stats.empty else 0
             
             return {
                 'department_stats': dept_stats.to_dict('records'),
-                'total_records': int(dept_stats['record_count'].sum()) if not dept_stats.empty else 0,
-                'classified_records': int(dept_stats[dept_stats['department'] != '未分类']['record_count'].sum()) 
-                                     if not dept_stats.empty else 0,
-                'unclassified_records': int(dept_stats[dept_stats['department'] == '未分类']['record_count'].sum()) 
-                                       if not dept_stats.empty else 0
+                'total_records': total_records,
+                'classified_records': total_records - unclassified_records,
+                'unclassified_records': unclassified_records
             }
     except Exception as e:
         st.error(f"加载部门统计失败: {str(e)}")
         return {'department_stats': [], 'total_records': 0, 'classified_records': 0, 'unclassified_records': 0}
 
+def get_department_list(year_filter, data_version=None):
+    """获取部门列表（复用已缓存的部门统计结果，不再单独扫描销售明细）"""
+    dept_data = get_cached_department_stats(year_filter, data_version=data_version)
+    return sorted(
+        dept['department'] for dept in dept_data['department_stats']
+        if dept['department'] != '未分类'
+    )
+
 @st.cache_data(ttl=300)
-def get_cached_department_stats_detail(department, year_filter):
+def get_cached_department_stats_detail(department, year_filter, data_version=None):
     """获取部门详细统计"""
     try:
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             year_condition = ""
             params = [department]
             
             if year_filter != "全部年份":
-                year_condition = "AND strftime('%Y', record_date) = ?"
-                params.append(year_filter)
+                year_condition = "AND record_date >= ? AND record_date < ?"
+                params.extend(year_date_range(year_filter))
             
             query = f'''
                 SELECT 
@@ -220,7 +221,7 @@ def get_cached_department_stats_detail(department, year_filter):
                 WHERE department = ? {year_condition}
             '''
             
-            result = pd.read_sql_query(query, conn, params=params)
+            result = query_df(conn, query, params)
             
             if result.empty:
                 return {
@@ -262,57 +263,190 @@ def get_cached_department_stats_detail(department, year_filter):
         }
 
 @st.cache_data(ttl=300)
-def get_cached_production_line_data(department, year_filter):
-    """获取部门生产线数据"""
+def get_cached_all_production_line_data(year_filter, data_version=None):
+    """一次查询获取所有部门的生产线数据，切换部门时直接从缓存中切片"""
     try:
-        with get_connection() as conn:
+        with get_read_connection() as conn:
             year_condition = ""
-            params = [department]
+            params = []
             
             if year_filter != "全部年份":
-                year_condition = "AND strftime('%Y', record_date) = ?"
-                params.append(year_filter)
+                year_condition = "AND record_date >= ? AND record_date < ?"
+                params = list(year_date_range(year_filter))
             
             query = f'''
                 SELECT 
+                    department,
                     production_line,
                     COUNT(*) as record_count,
                     SUM(amount) as total_amount,
                     SUM(quantity) as total_quantity,
                     AVG(unit_price) as avg_price
                 FROM sales_records
-                WHERE department = ? {year_condition}
-                GROUP BY production_line
-                HAVING record_count > 0
-                ORDER BY record_count DESC
-                LIMIT 20
+                WHERE department IS NOT NULL AND department != '' {year_condition}
+                GROUP BY department, production_line
+                ORDER BY department, record_count DESC
             '''
             
-            df = pd.read_sql_query(query, conn, params=params)
-            return df
+            df = query_df(conn, query, params)
+            return downcast_count_columns(df, ['record_count'])
     except Exception as e:
         st.error(f"获取生产线数据失败: {str(e)}")
         return pd.DataFrame()
 
-# ==================== ECharts图表函数 ====================
-def format_chinese_month(month_str):
-    """将YYYY-MM格式转换为中文月份格式"""
+def get_cached_production_line_data(department, year_filter, data_version=None):
+    """获取部门生产线数据"""
+    all_lines = get_cached_all_production_line_data(year_filter, data_version=data_version)
+    if all_lines.empty:
+        return all_lines
+    
+    # 结果已按部门、记录数降序排列，切片后保持原有顺序
+    dept_lines = all_lines[all_lines['department'] == department]
+    return dept_lines.drop(columns='department').head(20).reset_index(drop=True)
+
+@st.cache_data(ttl=300)
+def get_cached_department_product_stats(department, year_filter, data_version=None):
+    """获取部门热销产品统计（聚合在SQL中完成，只返回汇总行）"""
+    try:
+        with get_read_connection() as conn:
+            year_condition = ""
+            params = [department]
+            
+            if year_filter != "全部年份":
+                year_condition = "AND record_date >= ? AND record_date < ?"
+                params.extend(year_date_range(year_filter))
+            
+            product_query = f'''
+                SELECT 
+                    product_name,
+                    color,
+                    COUNT(*) as transaction_count,
+                    ROUND(AVG(unit_price), 2) as avg_price,
+                    SUM(quantity) as total_quantity,
+                    ROUND(SUM(amount), 2) as total_amount
+                FROM sales_records
+                WHERE department = ? {year_condition}
+                GROUP BY product_name, color
+                HAVING total_amount > 0
+                ORDER BY total_amount DESC
+                LIMIT 15
+            '''
+            
+            df = query_df(conn, product_query, params)
+            return downcast_count_columns(df, ['transaction_count'])
+    except Exception as e:
+        st.error(f"获取部门产品统计失败: {str(e)}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=300)
+def get_cached_monthly_trend(year_filter, department=None, data_version=None):
+    """获取月度趋势数据（读取月度汇总表，总体与部门视图共用）"""
     try:
-        year, month = month_str.split('-')
-        month_names = ['一月', '二月', '三月', '四月', '五月', '六月', 
-                      '七月', '八月', '九月', '十月', '十一月', '十二月']
-        return f"{year}年{month_names[int(month)-1]}"
-    except:
-        return month_str
+        with get_read_connection() as conn:
+            conditions = []
+            params = []
+
+            if department is not None:
+                conditions.append("department = ?")
+                params.append(department)
 
+            if year_filter != "全部年份":
+                conditions.append("substr(month, 1, 4) = ?")
+                params.append(year_filter)
+
+            conditions.append("month IS NOT NULL AND month != ''")
+            where_clause = f"WHERE {' AND '.join(conditions)}"
+
+            trend_query = f'''
+                SELECT
+                    month,
+                    SUM(transaction_count) as transaction_count,
+                    ROUND(SUM(total_amount), 2) as total_amount,
+                    ROUND(SUM(price_sum) / SUM(price_count), 2) as avg_price,
+                    SUM(total_quantity) as total_quantity
+                FROM sales_monthly_summary
+                {where_clause}
+                GROUP BY month
+                ORDER BY month
+            '''
+            trend = query_df(conn, trend_query, params)
+            return downcast_count_columns(trend, ['transaction_count'])
+    except Exception as e:
+        st.error(f"获取月度趋势数据失败: {str(e)}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=300)
+def get_cached_customer_product_stats(year_filter, data_version=None):
+    """获取客户与产品统计（按年份过滤）"""
+    try:
+        with get_read_connection() as conn:
+            year_condition = ""
+            params = []
+
+            if year_filter != "全部年份":
+                year_condition = "WHERE record_date >= ? AND record_date < ?"
+                params = list(year_date_range(year_filter))
+
+            # 客户和产品统计分别直接聚合销售表
+            customer_stats = query_df(conn, f'''
+                SELECT
+                    customer_name,
+                    COUNT(DISTINCT color) as product_colors,
+                    COUNT(*) as transaction_count,
+                    ROUND(SUM(amount), 2) as total_amount,
+                    ROUND(AVG(unit_price), 2) as avg_price
+                FROM sales_records
+                {year_condition}
+                GROUP BY customer_name
+                HAVING total_amount > 0
+                ORDER BY total_amount DESC
+                LIMIT 20
+            ''', params)
+
+            product_stats = query_df(conn, f'''
+                SELECT
+                    product_name,
+                    color,
+                    COALESCE(NULLIF(grade, ''), '无等级') as grade,
+                    COUNT(*) as transaction_count,
+                    ROUND(AVG(unit_price), 2) as avg_price,
+                    SUM(quantity) as total_quantity,
+                    ROUND(SUM(amount), 2) as total_amount
+                FROM sales_records
+                {year_condition}
+                GROUP BY product_name, color, grade
+                HAVING total_amount > 0
+                ORDER BY total_amount DESC
+                LIMIT 25
+            ''', params)
+
+            return (downcast_count_columns(customer_stats, ['product_colors', 'transaction_count']),
+                    downcast_count_columns(product_stats, ['transaction_count']))
+    except Exception as e:
+        st.error(f"获取客户与产品统计失败: {str(e)}")
+        return pd.DataFrame(), pd.DataFrame()
+
+@st.cache_data(ttl=300)
+def get_csv_bytes(df):
+    """缓存导出用的CSV字节，重复下载不再重新序列化"""
+    return dataframe_to_csv_bytes(df)
+
+# ==================== ECharts图表函数 ====================
+# 图表配置构建函数均使用缓存：数据不变时重跑页面直接复用已生成的配置字典
+def format_chinese_months(months):
+    """将YYYY-MM格式的月份序列批量转换为中文月份格式，无法解析的值保持原样"""
+    parts = months.astype(str).str.extract(r'^(\d{4})-(\d{1,2})$')
+    month_names = pd.to_numeric(parts[1], errors='coerce').map(CHINESE_MONTH_NAMES)
+    return (parts[0] + '年' + month_names).fillna(months)
+
+@st.cache_data(ttl=300, show_spinner=False)
 def create_echarts_line_bar_mix(monthly_data, title, primary_col, secondary_col, 
                                primary_name="销售额", secondary_name="交易次数"):
     """创建ECharts混合图表（折线+柱状）"""
     if monthly_data.empty or len(monthly_data) <= 1:
         return None
     
-    monthly_data = monthly_data.copy()
-    months = [format_chinese_month(m) for m in monthly_data['month'].tolist()]
+    months = format_chinese_months(monthly_data['month']).tolist()
     
     option = {
         "title": {
@@ -414,6 +548,8 @@ def create_echarts_line_bar_mix(monthly_data, title, primary_col, secondary_col,
                 },
                 "symbolSize": 8,
                 "smooth": True,
+                # 数据点超过绘图像素时由前端按 LTTB 降采样，保持曲线形态
+                "sampling": "lttb",
                 "emphasis": {
                     "focus": "series"
                 }
@@ -462,17 +598,17 @@ def create_echarts_line_bar_mix(monthly_data, title, primary_col, secondary_col,
     
     return option
 
+@st.cache_data(ttl=300, show_spinner=False)
 def create_echarts_pie_chart(data, value_col, name_col, title, radius=['40%', '70%']):
     """创建ECharts饼图"""
     if data.empty:
         return None
     
-    chart_data = []
-    for _, row in data.iterrows():
-        chart_data.append({
-            "value": float(row[value_col]),
-            "name": str(row[name_col])
-        })
+    # 整列转换后再组装，避免逐行 iterrows 构造 Series
+    chart_data = [
+        {"value": value, "name": name}
+        for value, name in zip(data[value_col].astype(float).tolist(), data[name_col].astype(str).tolist())
+    ]
     
     option = {
         # "title": {
@@ -520,6 +656,7 @@ def create_echarts_pie_chart(data, value_col, name_col, title, radius=['40%', '7
     
     return option
 
+@st.cache_data(ttl=300, show_spinner=False)
 def create_echarts_bar_chart(data, x_col, y_col, title, color_scheme='primary'):
     """创建ECharts柱状图"""
     if data.empty:
@@ -605,42 +742,41 @@ def create_echarts_bar_chart(data, x_col, y_col, title, color_scheme='primary'):
     return option
 
 # ==================== 总数分析组件 ====================
+def render_metric_grid(metrics, per_row=4):
+    """按行渲染指标卡片，metrics 为 (标签, 显示值) 列表"""
+    # 只创建一组列容器，指标按顺序轮流放入各列，多行指标共用同一布局
+    cols = st.columns(per_row)
+    for i, (label, value) in enumerate(metrics):
+        cols[i % per_row].metric(label, value)
+
 def render_total_metrics_optimized(stats):
     """总数分析指标"""
     # 使用Streamlit原生metric组件
     st.markdown("### 📈 核心业务指标")
     
-    cols = st.columns(4)
-    with cols[0]:
-        st.metric("总记录数", f"{int(stats['total_records']):,}")
-    with cols[1]:
-        st.metric("总销售额", f"¥{int(stats['total_amount']):,}")
-    with cols[2]:
-        st.metric("客户总数", f"{int(stats['unique_customers']):,}")
-    with cols[3]:
-        st.metric("产品总数", f"{int(stats['unique_products']):,}")
+    date_range_text = "暂无数据"
+    if stats['date_range'] and stats['date_range']['start']:
+        start = stats['date_range']['start'][:10] if stats['date_range']['start'] else "未知"
+        end = stats['date_range']['end'][:10] if stats['date_range']['end'] else "未知"
+        date_range_text = f"{start} 至 {end}"
     
-    # 第二行指标
-    cols2 = st.columns(4)
-    with cols2[0]:
-        date_range_text = "暂无数据"
-        if stats['date_range'] and stats['date_range']['start']:
-            start = stats['date_range']['start'][:10] if stats['date_range']['start'] else "未知"
-            end = stats['date_range']['end'][:10] if stats['date_range']['end'] else "未知"
-            date_range_text = f"{start} 至 {end}"
-        st.metric("交易时间范围", date_range_text)
-    with cols2[1]:
-        st.metric("总销售量", f"{int(stats['total_quantity']):,}")
-    with cols2[2]:
-        st.metric("颜色种类", f"{int(stats['unique_colors']):,}")
-    with cols2[3]:
-        st.metric("平均单价", f"¥{stats['avg_price']:,.2f}")
+    render_metric_grid([
+        ("总记录数", f"{int(stats['total_records']):,}"),
+        ("总销售额", f"¥{int(stats['total_amount']):,}"),
+        ("客户总数", f"{int(stats['unique_customers']):,}"),
+        ("产品总数", f"{int(stats['unique_products']):,}"),
+        ("交易时间范围", date_range_text),
+        ("总销售量", f"{int(stats['total_quantity']):,}"),
+        ("颜色种类", f"{int(stats['unique_colors']):,}"),
+        ("平均单价", f"¥{stats['avg_price']:,.2f}")
+    ])
 
+@st.fragment
 def render_total_analysis_optimized(year_filter):
-    """渲染优化的总数分析"""
+    """渲染优化的总数分析（片段内交互只重跑本区域）"""
     try:
         # 获取统计数据
-        stats = get_cached_total_stats(year_filter)
+        stats = get_cached_total_stats(year_filter, data_version=data_version)
         
         if stats['total_records'] == 0:
             st.warning(f"⚠️ {year_filter if year_filter != '全部年份' else ''}暂无数据")
@@ -655,336 +791,225 @@ def render_total_analysis_optimized(year_filter):
         # 关键指标概览
         render_total_metrics_optimized(stats)
         
-        # 部门销售额分析
-        st.markdown("### 🏢 部门业绩分析")
-        
-        dept_data = get_cached_department_stats(year_filter)
-        if dept_data['department_stats']:
-            dept_df = pd.DataFrame(dept_data['department_stats'])
-            col1, col2 = st.columns(2)
+        monthly_trend = get_cached_monthly_trend(year_filter, data_version=data_version)
+        customer_stats, product_stats = get_cached_customer_product_stats(
+            year_filter, data_version=data_version
+        )
+
+        # 各分析模块放入选项卡，页面首屏只展示当前选项卡的图表
+        dept_tab, trend_tab, customer_tab, product_tab, export_tab = st.tabs(
+            ["🏢 部门业绩", "📅 业务趋势", "👥 客户价值", "🏺 产品表现", "💾 数据导出"]
+        )
+
+        with dept_tab:
+            dept_data = get_cached_department_stats(year_filter, data_version=data_version)
+            if dept_data['department_stats']:
+                dept_df = pd.DataFrame(dept_data['department_stats'])
+                col1, col2 = st.columns(2)
             
-            with col1:
-                st.markdown("#### 部门销售额对比")
-                if not dept_df.empty:
-                    option = create_echarts_bar_chart(
-                        dept_df.head(10), 'department', 'total_amount',
-                        "部门销售额排名", 'primary'
-                    )
-                    if option:
-                        st_echarts(option, height=400)
+                with col1:
+                    st.markdown("#### 部门销售额对比")
+                    if not dept_df.empty:
+                        option = create_echarts_bar_chart(
+                            dept_df.head(10), 'department', 'total_amount',
+                            "部门销售额排名", 'primary'
+                        )
+                        if option:
+                            st_echarts(option, height=400, key="total_dept_bar")
             
-            with col2:
-                st.markdown("#### 部门销售占比")
-                filtered_dept = dept_df[dept_df['department'] != '未分类']
-                if not filtered_dept.empty:
-                    option = create_echarts_pie_chart(
-                        filtered_dept, 'total_amount', 'department',
-                        "部门销售额占比", ['30%', '75%']
-                    )
-                    if option:
-                        st_echarts(option, height=400)
-        
-        # 时间趋势分析
-        st.markdown("### 📅 业务趋势分析")
+                with col2:
+                    st.markdown("#### 部门销售占比")
+                    filtered_dept = dept_df[dept_df['department'] != '未分类']
+                    if not filtered_dept.empty:
+                        option = create_echarts_pie_chart(
+                            filtered_dept, 'total_amount', 'department',
+                            "部门销售额占比", ['30%', '75%']
+                        )
+                        if option:
+                            st_echarts(option, height=400, key="total_dept_pie")
         
-        with get_connection() as conn:
-            year_condition = ""
-            params = []
+        with trend_tab:
+            if not monthly_trend.empty and len(monthly_trend) > 1:
+                col1, col2 = st.columns(2)
             
-            if year_filter != "全部年份":
-                year_condition = "WHERE strftime('%Y', record_date) = ?"
-                params = [year_filter]
-            
-            trend_query = f'''
-                SELECT 
-                    strftime('%Y-%m', record_date) as month,
-                    COUNT(*) as transaction_count,
-                    ROUND(SUM(amount), 2) as total_amount,
-                    ROUND(AVG(unit_price), 2) as avg_price,
-                    SUM(quantity) as total_quantity
-                FROM sales_records
-                {year_condition}
-                GROUP BY strftime('%Y-%m', record_date)
-                HAVING month IS NOT NULL AND month != ''
-                ORDER BY month
-            '''
-            monthly_trend = pd.read_sql_query(trend_query, conn, params=params)
-        
-        if not monthly_trend.empty and len(monthly_trend) > 1:
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                option1 = create_echarts_line_bar_mix(
-                    monthly_trend, 
-                    "📊 销售额 vs 交易量趋势",
-                    'total_amount', 'transaction_count',
-                    "销售额", "交易次数"
-                )
-                if option1:
-                    st_echarts(option1, height=400)
+                with col1:
+                    option1 = create_echarts_line_bar_mix(
+                        monthly_trend, 
+                        "📊 销售额 vs 交易量趋势",
+                        'total_amount', 'transaction_count',
+                        "销售额", "交易次数"
+                    )
+                    if option1:
+                        st_echarts(option1, height=400, key="total_trend_amount")
             
-            with col2:
-                option2 = create_echarts_line_bar_mix(
-                    monthly_trend,
-                    "📦 平均单价 vs 销售数量趋势",
-                    'avg_price', 'total_quantity',
-                    "平均单价", "销售数量"
-                )
-                if option2:
-                    st_echarts(option2, height=400)
+                with col2:
+                    option2 = create_echarts_line_bar_mix(
+                        monthly_trend,
+                        "📦 平均单价 vs 销售数量趋势",
+                        'avg_price', 'total_quantity',
+                        "平均单价", "销售数量"
+                    )
+                    if option2:
+                        st_echarts(option2, height=400, key="total_trend_price")
             
-            # 月度详细数据表格
-            with st.expander("📈 月度详细数据", expanded=False):
-                display_monthly = monthly_trend.copy()
-                display_monthly['月份'] = display_monthly['month'].apply(format_chinese_month)
-                display_monthly['交易次数'] = display_monthly['transaction_count']
-                display_monthly['总金额'] = display_monthly['total_amount'].round(2)
-                display_monthly['平均价格'] = display_monthly['avg_price'].round(2)
-                display_monthly['总数量'] = display_monthly['total_quantity']
+                # 月度详细数据表格
+                with st.expander("📈 月度详细数据", expanded=False):
+                    display_monthly = pd.DataFrame({
+                        '月份': format_chinese_months(monthly_trend['month']),
+                        '交易次数': monthly_trend['transaction_count'],
+                        '总金额': monthly_trend['total_amount'],
+                        '平均价格': monthly_trend['avg_price'],
+                        '总数量': monthly_trend['total_quantity']
+                    })
                 
-                st.dataframe(
-                    display_monthly[['月份', '交易次数', '总金额', '平均价格', '总数量']],
-                    width='stretch',
-                    hide_index=True
-                )
-        else:
-            st.info("暂无足够的时间趋势数据")
-        
-        # 客户分析
-        st.markdown("### 👥 客户价值分析")
-        
-        with get_connection() as conn:
-            year_condition = ""
-            params = []
-            
-            if year_filter != "全部年份":
-                year_condition = "WHERE strftime('%Y', record_date) = ?"
-                params = [year_filter]
-            
-            customer_query = f'''
-                SELECT 
-                    customer_name,
-                    COUNT(DISTINCT color) as product_colors,
-                    COUNT(*) as transaction_count,
-                    ROUND(SUM(amount), 2) as total_amount,
-                    ROUND(AVG(unit_price), 2) as avg_price
-                FROM sales_records
-                {year_condition}
-                GROUP BY customer_name
-                HAVING total_amount > 0
-                ORDER BY total_amount DESC
-                LIMIT 20
-            '''
-            customer_stats = pd.read_sql_query(customer_query, conn, params=params)
+                    st.dataframe(
+                        display_monthly,
+                        width='stretch',
+                        hide_index=True,
+                        column_config={
+                            '总金额': st.column_config.NumberColumn(format="¥%.2f"),
+                            '平均价格': st.column_config.NumberColumn(format="¥%.2f")
+                        }
+                    )
+            else:
+                st.info("暂无足够的时间趋势数据")
         
-        if not customer_stats.empty:
-            col1, col2 = st.columns(2)
+        with customer_tab:
+            if not customer_stats.empty:
+                col1, col2 = st.columns(2)
             
-            with col1:
-                st.markdown("#### 🏆 TOP客户销售额")
-                top_customers = customer_stats.head(10)
+                with col1:
+                    st.markdown("#### 🏆 TOP客户销售额")
+                    top_customers = customer_stats.head(10)
                 
-                option = create_echarts_bar_chart(
-                    top_customers, 'customer_name', 'total_amount',
-                    "TOP客户销售额", 'primary'
-                )
-                if option:
-                    st_echarts(option)
+                    option = create_echarts_bar_chart(
+                        top_customers, 'customer_name', 'total_amount',
+                        "TOP客户销售额", 'primary'
+                    )
+                    if option:
+                        st_echarts(option, key="total_top_customers")
             
-            with col2:
-                # 客户价值分析表格
-                st.markdown("#### 💬 客户详情统计")
-                display_customers = customer_stats.copy()
-                display_customers = display_customers.rename(columns={
-                    'customer_name': '客户名称',
-                    'total_amount': '总金额',
-                    'transaction_count': '交易次数',
-                    'product_colors': '产品颜色数',
-                    'avg_price': '平均单价'
-                })
+                with col2:
+                    # 客户价值分析表格
+                    st.markdown("#### 💬 客户详情统计")
+                    display_customers = customer_stats.rename(columns={
+                        'customer_name': '客户名称',
+                        'total_amount': '总金额',
+                        'transaction_count': '交易次数',
+                        'product_colors': '产品颜色数',
+                        'avg_price': '平均单价'
+                    })
                 
-                st.dataframe(
-                    display_customers[['客户名称', '总金额', '交易次数', '产品颜色数', '平均单价']],
-                    width='stretch',
-                    hide_index=True
-                )
-        
-        # 产品分析
-        st.markdown("### 🏺 产品表现分析")
-        
-        with get_connection() as conn:
-            year_condition = ""
-            params = []
-            
-            if year_filter != "全部年份":
-                year_condition = "WHERE strftime('%Y', record_date) = ?"
-                params = [year_filter]
-            
-            product_query = f'''
-                SELECT 
-                    product_name,
-                    color,
-                    COALESCE(NULLIF(grade, ''), '无等级') as grade,
-                    COUNT(*) as transaction_count,
-                    ROUND(AVG(unit_price), 2) as avg_price,
-                    SUM(quantity) as total_quantity,
-                    ROUND(SUM(amount), 2) as total_amount
-                FROM sales_records
-                {year_condition}
-                GROUP BY product_name, color, grade
-                HAVING total_amount > 0
-                ORDER BY total_amount DESC
-                LIMIT 25
-            '''
-            product_stats = pd.read_sql_query(product_query, conn, params=params)
+                    st.dataframe(
+                        display_customers[['客户名称', '总金额', '交易次数', '产品颜色数', '平均单价']],
+                        width='stretch',
+                        hide_index=True
+                    )
         
-        if not product_stats.empty:
-            col1, col2 = st.columns(2)
+        with product_tab:
+            if not product_stats.empty:
+                col1, col2 = st.columns(2)
             
-            with col1:
-                st.markdown("#### 🔥 热销产品TOP10")
-                top_products = product_stats.head(10)
-                top_products['product_display'] = top_products.apply(
-                    lambda x: f"{x['product_name']} - {x['color']}", axis=1
-                )
+                with col1:
+                    st.markdown("#### 🔥 热销产品TOP10")
+                    top_products = product_stats.head(10).assign(
+                        product_display=lambda df: df['product_name'].astype(str) + ' - ' + df['color'].astype(str)
+                    )
                 
-                option = create_echarts_bar_chart(
-                    top_products, 'product_display', 'total_amount',
-                    "热销产品销售额", 'danger'
-                )
-                if option:
-                    st_echarts(option)
+                    option = create_echarts_bar_chart(
+                        top_products, 'product_display', 'total_amount',
+                        "热销产品销售额", 'danger'
+                    )
+                    if option:
+                        st_echarts(option, key="total_top_products")
             
-            with col2:
-                # 产品价格分析表格
-                st.markdown("#### 📊 产品价格统计")
-                display_products = product_stats.copy()
-                display_products = display_products.rename(columns={
-                    'product_name': '产品名称',
-                    'color': '颜色',
-                    'grade': '等级',
-                    'total_amount': '总金额',
-                    'transaction_count': '交易次数',
-                    'total_quantity': '总数量',
-                    'avg_price': '平均单价'
-                })
+                with col2:
+                    # 产品价格分析表格
+                    st.markdown("#### 📊 产品价格统计")
+                    display_products = product_stats.rename(columns={
+                        'product_name': '产品名称',
+                        'color': '颜色',
+                        'grade': '等级',
+                        'total_amount': '总金额',
+                        'transaction_count': '交易次数',
+                        'total_quantity': '总数量',
+                        'avg_price': '平均单价'
+                    })
                 
-                st.dataframe(
-                    display_products[['产品名称', '颜色', '等级', '总金额', '交易次数', '总数量', '平均单价']],
-                    width='stretch',
-                    hide_index=True
-                )
+                    st.dataframe(
+                        display_products[['产品名称', '颜色', '等级', '总金额', '交易次数', '总数量', '平均单价']],
+                        width='stretch',
+                        hide_index=True
+                    )
         
-        # 数据导出
-        st.markdown("### 💾 数据导出")
-        cols = st.columns(4)
+        with export_tab:
+            cols = st.columns(4)
         
-        with cols[0]:
-            if 'monthly_trend' in locals() and not monthly_trend.empty:
-                csv_monthly = monthly_trend.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="📈 导出月度趋势",
-                    data=csv_monthly,
-                    file_name=f"月度趋势_{year_filter}.csv",
-                    mime="text/csv",
-                    width='stretch'
-                )
+            with cols[0]:
+                if 'monthly_trend' in locals() and not monthly_trend.empty:
+                    st.download_button(
+                        label="📈 导出月度趋势",
+                        data=lambda: get_csv_bytes(monthly_trend),
+                        file_name=f"月度趋势_{year_filter}.csv",
+                        mime="text/csv",
+                        width='stretch'
+                    )
         
-        with cols[1]:
-            if 'customer_stats' in locals() and not customer_stats.empty:
-                csv_customer = customer_stats.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="👥 导出客户分析",
-                    data=csv_customer,
-                    file_name=f"客户分析_{year_filter}.csv",
-                    mime="text/csv",
-                    width='stretch'
-                )
+            with cols[1]:
+                if 'customer_stats' in locals() and not customer_stats.empty:
+                    st.download_button(
+                        label="👥 导出客户分析",
+                        data=lambda: get_csv_bytes(customer_stats),
+                        file_name=f"客户分析_{year_filter}.csv",
+                        mime="text/csv",
+                        width='stretch'
+                    )
+        
+            with cols[2]:
+                if 'product_stats' in locals() and not product_stats.empty:
+                    st.download_button(
+                        label="🏺 导出产品分析",
+                        data=lambda: get_csv_bytes(product_stats),
+                        file_name=f"产品分析_{year_filter}.csv",
+                        mime="text/csv",
+                        width='stretch'
+                    )
         
-        with cols[2]:
-            if 'product_stats' in locals() and not product_stats.empty:
-                csv_product = product_stats.to_csv(index=False, encoding='utf-8-sig')
+            with cols[3]:
+                summary_data = {
+                    '指标': ['总记录数', '总销售额', '客户总数', '产品总数', '平均单价', '交易均额'],
+                    '数值': [
+                        stats['total_records'],
+                        stats['total_amount'],
+                        stats['unique_customers'],
+                        stats['unique_products'],
+                        stats['avg_price'],
+                        stats['avg_transaction_amount']
+                    ]
+                }
+                summary_df = pd.DataFrame(summary_data)
                 st.download_button(
-                    label="🏺 导出产品分析",
-                    data=csv_product,
-                    file_name=f"产品分析_{year_filter}.csv",
+                    label="📊 导出指标摘要",
+                    data=lambda: get_csv_bytes(summary_df),
+                    file_name=f"指标摘要_{year_filter}.csv",
                     mime="text/csv",
                     width='stretch'
                 )
-        
-        with cols[3]:
-            summary_data = {
-                '指标': ['总记录数', '总销售额', '客户总数', '产品总数', '平均单价', '交易均额'],
-                '数值': [
-                    stats['total_records'],
-                    stats['total_amount'],
-                    stats['unique_customers'],
-                    stats['unique_products'],
-                    stats['avg_price'],
-                    stats['avg_transaction_amount']
-                ]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            csv_summary = summary_df.to_csv(index=False, encoding='utf-8-sig')
-            st.download_button(
-                label="📊 导出指标摘要",
-                data=csv_summary,
-                file_name=f"指标摘要_{year_filter}.csv",
-                mime="text/csv",
-                width='stretch'
-            )
                 
     except Exception as e:
         st.error(f"获取统计数据时出错: {str(e)}")
         st.info("请确保已正确导入数据并初始化数据库")
 
+@st.fragment
 def create_department_analysis_tab_optimized(department, year_filter):
-    """部门分析选项卡内容"""
+    """部门分析选项卡内容（片段内交互只重跑本区域）"""
     try:
-        # 获取部门详细数据
-        with get_connection() as conn:
-            year_condition = ""
-            params = [department]
-            
-            if year_filter != "全部年份":
-                year_condition = "AND strftime('%Y', record_date) = ?"
-                params.append(year_filter)
-            
-            # 部门统计数据
-            stats_query = f'''
-                SELECT 
-                    COUNT(*) as total_records,
-                    COUNT(DISTINCT customer_name) as customer_count,
-                    COUNT(DISTINCT product_name) as product_count,
-                    COUNT(DISTINCT color) as color_count,
-                    COALESCE(SUM(quantity), 0) as total_quantity,
-                    COALESCE(SUM(amount), 0) as total_amount,
-                    COALESCE(AVG(unit_price), 0) as avg_price,
-                    MIN(record_date) as earliest_date,
-                    MAX(record_date) as latest_date
-                FROM sales_records
-                WHERE department = ? {year_condition}
-            '''
-            
-            result = pd.read_sql_query(stats_query, conn, params=params)
-            
-            if result.empty or result.iloc[0]['total_records'] == 0:
-                st.warning(f"⚠️ {department}暂无{year_filter if year_filter != '全部年份' else ''}数据")
-                return
-            
-            dept_stats = {
-                'total_records': int(result.iloc[0]['total_records']),
-                'customer_count': int(result.iloc[0]['customer_count']),
-                'product_count': int(result.iloc[0]['product_count']),
-                'color_count': int(result.iloc[0]['color_count']),
-                'total_quantity': int(result.iloc[0]['total_quantity']),
-                'total_amount': float(result.iloc[0]['total_amount']),
-                'avg_price': float(result.iloc[0]['avg_price']),
-                'date_range': {
-                    'start': result.iloc[0]['earliest_date'],
-                    'end': result.iloc[0]['latest_date']
-                }
-            }
+        # 部门汇总指标（缓存的聚合结果，不拉取明细数据）
+        dept_stats = get_cached_department_stats_detail(department, year_filter, data_version=data_version)
+        
+        if dept_stats['total_records'] == 0:
+            st.warning(f"⚠️ {department}暂无{year_filter if year_filter != '全部年份' else ''}数据")
+            return
         
         # 部门标题
         if year_filter != "全部年份":
@@ -995,259 +1020,216 @@ def create_department_analysis_tab_optimized(department, year_filter):
         # 关键指标
         st.subheader(f"📈 {department}关键指标")
         
-        cols = st.columns(4)
-        with cols[0]:
-            st.metric("总记录数", f"{dept_stats['total_records']:,}")
-        with cols[1]:
-            st.metric("客户数量", f"{dept_stats['customer_count']:,}")
-        with cols[2]:
-            st.metric("产品数量", f"{dept_stats['product_count']:,}")
-        with cols[3]:
-            st.metric("颜色种类", f"{dept_stats['color_count']:,}")
-        
-        cols2 = st.columns(4)
-        with cols2[0]:
-            st.metric("总金额", f"¥{int(dept_stats['total_amount']):,}")
-        with cols2[1]:
-            st.metric("总数量", f"{dept_stats['total_quantity']:,}")
-        with cols2[2]:
-            st.metric("平均价格", f"¥{dept_stats['avg_price']:.2f}")
-        with cols2[3]:
-            date_range_text = "暂无数据"
-            if dept_stats['date_range'] and dept_stats['date_range']['start']:
-                start = dept_stats['date_range']['start'][:10]
-                end = dept_stats['date_range']['end'][:10]
-                date_range_text = f"{start} 至 {end}"
-            st.metric("数据周期", date_range_text)
+        date_range_text = "暂无数据"
+        if dept_stats['date_range'] and dept_stats['date_range']['start']:
+            start = dept_stats['date_range']['start'][:10]
+            end = dept_stats['date_range']['end'][:10]
+            date_range_text = f"{start} 至 {end}"
         
-        # 生产线详细分析
-        st.markdown("---")
-        st.subheader("🏭 生产线详细分析")
+        render_metric_grid([
+            ("总记录数", f"{dept_stats['total_records']:,}"),
+            ("客户数量", f"{dept_stats['customer_count']:,}"),
+            ("产品数量", f"{dept_stats['product_count']:,}"),
+            ("颜色种类", f"{dept_stats['color_count']:,}"),
+            ("总金额", f"¥{int(dept_stats['total_amount']):,}"),
+            ("总数量", f"{dept_stats['total_quantity']:,}"),
+            ("平均价格", f"¥{dept_stats['avg_price']:.2f}"),
+            ("数据周期", date_range_text)
+        ])
         
-        production_data = get_cached_production_line_data(department, year_filter)
+        # 各分析模块放入选项卡，页面首屏只展示当前选项卡的图表
+        line_tab, trend_tab, product_tab, export_tab = st.tabs(
+            ["🏭 生产线分析", "📅 时间趋势", "🏺 产品分析", "💾 数据导出"]
+        )
+
+        with line_tab:
+            production_data = get_cached_production_line_data(department, year_filter, data_version=data_version)
         
-        if not production_data.empty:
-            col1, col2 = st.columns(2)
+            if not production_data.empty:
+                col1, col2 = st.columns(2)
             
-            with col1:
-                st.markdown("#### 生产线记录数TOP10")
-                top_lines = production_data.nlargest(10, 'record_count')
-                option = create_echarts_bar_chart(
-                    top_lines, 'production_line', 'record_count',
-                    f"{department}生产线记录数TOP10", 'warning'
-                )
-                if option:
-                    st_echarts(option, height=400)
+                with col1:
+                    st.markdown("#### 生产线记录数TOP10")
+                    # SQL 已按记录数降序返回，直接取前10行即可
+                    top_lines = production_data.head(10)
+                    option = create_echarts_bar_chart(
+                        top_lines, 'production_line', 'record_count',
+                        f"{department}生产线记录数TOP10", 'warning'
+                    )
+                    if option:
+                        st_echarts(option, height=400, key="dept_line_bar")
             
-            with col2:
-                st.markdown("#### 生产线销售额分布")
-                option = create_echarts_pie_chart(
-                    production_data, 'total_amount', 'production_line',
-                    f"{department}生产线销售额分布", ['30%', '75%']
-                )
-                if option:
-                    st_echarts(option, height=400)
+                with col2:
+                    st.markdown("#### 生产线销售额分布")
+                    option = create_echarts_pie_chart(
+                        production_data, 'total_amount', 'production_line',
+                        f"{department}生产线销售额分布", ['30%', '75%']
+                    )
+                    if option:
+                        st_echarts(option, height=400, key="dept_line_pie")
             
-            # 生产线详细数据表
-            # st.markdown("#### 📋 生产线详细数据")
-            with st.expander("💬 查看客户详情统计", expanded=False):
-                display_lines = production_data.copy()
-                display_lines = display_lines.rename(columns={
-                    'production_line': '生产线',
-                    'record_count': '记录数',
-                    'total_amount': '总金额',
-                    'total_quantity': '总数量',
-                    'avg_price': '平均价格'
-                })
+                # 生产线详细数据表
+                # st.markdown("#### 📋 生产线详细数据")
+                with st.expander("💬 查看客户详情统计", expanded=False):
+                    display_lines = production_data.rename(columns={
+                        'production_line': '生产线',
+                        'record_count': '记录数',
+                        'total_amount': '总金额',
+                        'total_quantity': '总数量',
+                        'avg_price': '平均价格'
+                    })
                 
-                st.dataframe(
-                    display_lines[['生产线', '记录数', '总数量', '平均价格', '总金额']],
-                    width='stretch',
-                    hide_index=True
-                )
-        
-        # 时间趋势分析
-        st.markdown("---")
-        st.subheader("📅 时间趋势分析")
-        
-        with get_connection() as conn:
-            year_condition = ""
-            params = [department]
-            
-            if year_filter != "全部年份":
-                year_condition = "AND strftime('%Y', record_date) = ?"
-                params.append(year_filter)
-            
-            trend_query = f'''
-                SELECT 
-                    strftime('%Y-%m', record_date) as month,
-                    COUNT(*) as transaction_count,
-                    ROUND(SUM(amount), 2) as total_amount,
-                    ROUND(AVG(unit_price), 2) as avg_price,
-                    SUM(quantity) as total_quantity
-                FROM sales_records
-                WHERE department = ? {year_condition}
-                GROUP BY strftime('%Y-%m', record_date)
-                HAVING month IS NOT NULL AND month != ''
-                ORDER BY month
-            '''
-            monthly_trend = pd.read_sql_query(trend_query, conn, params=params)
+                    st.dataframe(
+                        display_lines[['生产线', '记录数', '总数量', '平均价格', '总金额']],
+                        width='stretch',
+                        hide_index=True
+                    )
         
-        if not monthly_trend.empty and len(monthly_trend) > 1:
-            col1, col2 = st.columns(2)
+        with trend_tab:
+            monthly_trend = get_cached_monthly_trend(year_filter, department, data_version=data_version)
+
+            if not monthly_trend.empty and len(monthly_trend) > 1:
+                col1, col2 = st.columns(2)
             
-            with col1:
-                option1 = create_echarts_line_bar_mix(
-                    monthly_trend, 
-                    f"📊 {department}销售额 vs 交易量趋势",
-                    'total_amount', 'transaction_count',
-                    "销售额", "交易次数"
-                )
-                if option1:
-                    st_echarts(option1, height=400)
+                with col1:
+                    option1 = create_echarts_line_bar_mix(
+                        monthly_trend, 
+                        f"📊 {department}销售额 vs 交易量趋势",
+                        'total_amount', 'transaction_count',
+                        "销售额", "交易次数"
+                    )
+                    if option1:
+                        st_echarts(option1, height=400, key="dept_trend_amount")
             
-            with col2:
-                option2 = create_echarts_line_bar_mix(
-                    monthly_trend,
-                    f"📦 {department}平均单价 vs 销售数量趋势",
-                    'avg_price', 'total_quantity',
-                    "平均单价", "销售数量"
-                )
-                if option2:
-                    st_echarts(option2, height=400)
+                with col2:
+                    option2 = create_echarts_line_bar_mix(
+                        monthly_trend,
+                        f"📦 {department}平均单价 vs 销售数量趋势",
+                        'avg_price', 'total_quantity',
+                        "平均单价", "销售数量"
+                    )
+                    if option2:
+                        st_echarts(option2, height=400, key="dept_trend_price")
             
-            # 月度详细数据
-            with st.expander("📈 月度详细数据", expanded=False):
-                display_monthly = monthly_trend.copy()
-                display_monthly['月份'] = display_monthly['month'].apply(format_chinese_month)
-                display_monthly['交易次数'] = display_monthly['transaction_count']
-                display_monthly['总金额'] = display_monthly['total_amount'].round(2)
-                display_monthly['平均价格'] = display_monthly['avg_price'].round(2)
-                display_monthly['总数量'] = display_monthly['total_quantity']
+                # 月度详细数据
+                with st.expander("📈 月度详细数据", expanded=False):
+                    display_monthly = pd.DataFrame({
+                        '月份': format_chinese_months(monthly_trend['month']),
+                        '交易次数': monthly_trend['transaction_count'],
+                        '总金额': monthly_trend['total_amount'],
+                        '平均价格': monthly_trend['avg_price'],
+                        '总数量': monthly_trend['total_quantity']
+                    })
                 
-                st.dataframe(
-                    display_monthly[['月份', '交易次数', '总金额', '平均价格', '总数量']],
-                    width='stretch',
-                    hide_index=True
-                )
+                    st.dataframe(
+                        display_monthly,
+                        width='stretch',
+                        hide_index=True,
+                        column_config={
+                            '总金额': st.column_config.NumberColumn(format="¥%.2f"),
+                            '平均价格': st.column_config.NumberColumn(format="¥%.2f")
+                        }
+                    )
         
-        # 产品分析
-        st.markdown("---")
-        st.subheader("🏺 产品分析")
+        with product_tab:
+            dept_products = get_cached_department_product_stats(department, year_filter, data_version=data_version)
         
-        with get_connection() as conn:
-            year_condition = ""
-            params = [department]
+            if not dept_products.empty:
+                col1, col2 = st.columns(2)
             
-            if year_filter != "全部年份":
-                year_condition = "AND strftime('%Y', record_date) = ?"
-                params.append(year_filter)
-            
-            product_query = f'''
-                SELECT 
-                    product_name,
-                    color,
-                    COUNT(*) as transaction_count,
-                    ROUND(AVG(unit_price), 2) as avg_price,
-                    SUM(quantity) as total_quantity,
-                    ROUND(SUM(amount), 2) as total_amount
-                FROM sales_records
-                WHERE department = ? {year_condition}
-                GROUP BY product_name, color
-                HAVING total_amount > 0
-                ORDER BY total_amount DESC
-                LIMIT 15
-            '''
-            dept_products = pd.read_sql_query(product_query, conn, params=params)
-        
-        if not dept_products.empty:
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("#### 热销产品TOP10")
-                top_products = dept_products.head(10)
-                top_products['product_display'] = top_products.apply(
-                    lambda x: f"{x['product_name']} - {x['color']}", axis=1
-                )
+                with col1:
+                    st.markdown("#### 热销产品TOP10")
+                    top_products = dept_products.head(10).assign(
+                        product_display=lambda df: df['product_name'].astype(str) + ' - ' + df['color'].astype(str)
+                    )
                 
-                option = create_echarts_bar_chart(
-                    top_products, 'product_display', 'total_amount',
-                    f"{department}热销产品TOP10", 'danger'
-                )
-                if option:
-                    st_echarts(option, height=400)
+                    option = create_echarts_bar_chart(
+                        top_products, 'product_display', 'total_amount',
+                        f"{department}热销产品TOP10", 'danger'
+                    )
+                    if option:
+                        st_echarts(option, height=400, key="dept_top_products")
             
-            with col2:
-                # 产品价格分析表格
-                st.markdown("#### 产品价格统计")
-                display_products = dept_products.copy()
-                display_products = display_products.rename(columns={
-                    'product_name': '产品名称',
-                    'color': '颜色',
-                    'total_amount': '总金额',
-                    'transaction_count': '交易次数',
-                    'total_quantity': '总数量',
-                    'avg_price': '平均价格'
-                })
+                with col2:
+                    # 产品价格分析表格
+                    st.markdown("#### 产品价格统计")
+                    display_products = dept_products.rename(columns={
+                        'product_name': '产品名称',
+                        'color': '颜色',
+                        'total_amount': '总金额',
+                        'transaction_count': '交易次数',
+                        'total_quantity': '总数量',
+                        'avg_price': '平均价格'
+                    })
                 
-                st.dataframe(
-                    display_products[['产品名称', '颜色', '总金额', '交易次数', '总数量', '平均价格']],
-                    width='stretch',
-                    hide_index=True
-                )
+                    st.dataframe(
+                        display_products[['产品名称', '颜色', '总金额', '交易次数', '总数量', '平均价格']],
+                        width='stretch',
+                        hide_index=True
+                    )
         
-        # 数据导出
-        st.markdown("---")
-        st.subheader("💾 数据导出")
+        with export_tab:
+            col1, col2, col3 = st.columns(3)
         
-        col1, col2 = st.columns(2)
+            with col1:
+                # 导出部门详细数据
+                if 'dept_stats' in locals():
+                    summary_data = {
+                        '指标': ['总记录数', '客户数量', '产品数量', '颜色种类', '总金额', '总数量', '平均价格'],
+                        '数值': [
+                            dept_stats['total_records'],
+                            dept_stats['customer_count'],
+                            dept_stats['product_count'],
+                            dept_stats['color_count'],
+                            dept_stats['total_amount'],
+                            dept_stats['total_quantity'],
+                            dept_stats['avg_price']
+                        ]
+                    }
+                    summary_df = pd.DataFrame(summary_data)
+                    st.download_button(
+                        label="📥 导出部门统计",
+                        data=lambda: get_csv_bytes(summary_df),
+                        file_name=f"{department}_{year_filter}_统计.csv",
+                        mime="text/csv",
+                        width='stretch'
+                    )
         
-        with col1:
-            # 导出部门详细数据
-            if 'dept_stats' in locals():
-                summary_data = {
-                    '指标': ['总记录数', '客户数量', '产品数量', '颜色种类', '总金额', '总数量', '平均价格'],
-                    '数值': [
-                        dept_stats['total_records'],
-                        dept_stats['customer_count'],
-                        dept_stats['product_count'],
-                        dept_stats['color_count'],
-                        dept_stats['total_amount'],
-                        dept_stats['total_quantity'],
-                        dept_stats['avg_price']
-                    ]
-                }
-                summary_df = pd.DataFrame(summary_data)
-                csv_summary = summary_df.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="📥 导出部门统计",
-                    data=csv_summary,
-                    file_name=f"{department}_{year_filter}_统计.csv",
-                    mime="text/csv",
-                    width='stretch'
-                )
+            with col2:
+                # 导出生产线数据
+                if 'production_data' in locals() and not production_data.empty:
+                    st.download_button(
+                        label="🏭 导出生产线数据",
+                        data=lambda: get_csv_bytes(production_data),
+                        file_name=f"{department}_{year_filter}_生产线数据.csv",
+                        mime="text/csv",
+                        width='stretch'
+                    )
         
-        with col2:
-            # 导出生产线数据
-            if 'production_data' in locals() and not production_data.empty:
-                csv_lines = production_data.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="🏭 导出生产线数据",
-                    data=csv_lines,
-                    file_name=f"{department}_{year_filter}_生产线数据.csv",
-                    mime="text/csv",
-                    width='stretch'
-                )
+            with col3:
+                # 导出产品数据（复用产品选项卡的缓存结果）
+                if 'dept_products' in locals() and not dept_products.empty:
+                    st.download_button(
+                        label="🏺 导出产品数据",
+                        data=lambda: get_csv_bytes(dept_products),
+                        file_name=f"{department}_{year_filter}_产品数据.csv",
+                        mime="text/csv",
+                        width='stretch'
+                    )
                 
     except Exception as e:
         st.error(f"分析{department}数据时出错: {str(e)}")
 
 # ==================== 侧边栏配置 ====================
+def set_current_view(view):
+    """导航按钮回调：在本次重跑开始前切换视图，只渲染选中的视图"""
+    st.session_state.current_view = view
+
 with st.sidebar:
     st.markdown("### ⚙️ 分析设置")
     
     # 年份选择器
-    available_years = get_available_years()
+    available_years = get_available_years(data_version=data_version)
     selected_year = st.selectbox(
         "选择分析年份",
         available_years,
@@ -1264,22 +1246,18 @@ with st.sidebar:
     st.markdown("### 🔍 快速导航")
     
     # 获取当前年份的部门列表
-    current_depts = get_department_list(selected_year)
+    current_depts = get_department_list(selected_year, data_version=data_version)
     
     # 使用session_state管理当前视图
     if 'current_view' not in st.session_state:
         st.session_state.current_view = "总数分析"
     
-    if st.button("📊 总体概览", width='stretch'):
-        st.session_state.current_view = "总数分析"
-        st.rerun()
+    st.button("📊 总体概览", width='stretch', on_click=set_current_view, args=("总数分析",))
     
     if current_depts:
         # st.markdown("**部门分析**")
         for dept in current_depts:
-            if st.button(f"🏢 {dept}", width='stretch'):
-                st.session_state.current_view = f"🏢 {dept}"
-                st.rerun()
+            st.button(f"🏢 {dept}", width='stretch', on_click=set_current_view, args=(f"🏢 {dept}",))
     else:
         st.info("暂无部门数据")
     
@@ -1287,7 +1265,7 @@ with st.sidebar:
     
     # 页面信息
     st.markdown("#### ℹ️ 页面信息")
-    stats = get_cached_total_stats(selected_year)
+    stats = get_cached_total_stats(selected_year, data_version=data_version)
     st.caption(f"• 总记录数: {int(stats['total_records']):,}")
     st.caption(f"• 数据时间: {selected_year}")
     st.caption(f"• 部门数量: {len(current_depts)}")
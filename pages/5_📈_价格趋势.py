@@ -1,11 +1,11 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-from core.analysis_service import AnalysisService
-from core.database import get_connection
+from core.database import get_read_connection, get_data_version
 from utils.auth import require_login
+from utils.file_utils import dataframe_to_csv_bytes
 
 st.logo(image='./assets/logo.png', icon_image='./assets/logo.png')
 st.set_page_config(page_title="价格趋势", layout="wide")
@@ -13,120 +13,146 @@ st.title("📈 价格趋势分析")
 
 require_login()
 
-analysis_service = AnalysisService()
+# 数据版本标识作为缓存键的一部分，导入新数据后缓存自动失效
+data_version = get_data_version()
+
+# 订单明细表格最多显示的行数（按日期倒序，导出不受限制）
+MAX_DISPLAY_ROWS = 1000
+
+# 产品月度汇总查询的聚合列类型，读取时直接按此构建列，无需 pandas 推断
+# （数量列可能为整数或小数，保持自动推断以免改变显示格式）
+AGGREGATE_DTYPES = {
+    'transaction_count': 'int64',
+    'total_amount': 'float64',
+    'price_sum': 'float64',
+    'price_count': 'int64'
+}
+
+# 订单明细中年/月/日列取值范围很小，按窄整数类型读取（金额与单价保持双精度，避免导出时出现精度误差）
+RECORD_DTYPES = {
+    'year': 'int16[pyarrow]',
+    'month': 'int8[pyarrow]',
+    'day': 'int8[pyarrow]'
+}
+
+@st.cache_data(ttl=300)
+def get_csv_bytes(df):
+    """缓存导出用的CSV字节，重复下载不再重新序列化"""
+    return dataframe_to_csv_bytes(df)
 
 # 获取基础数据
 @st.cache_data(ttl=300)
-def load_base_data():
+def load_base_data(data_version=None):
     """加载基础数据"""
-    with get_connection() as conn:
-        # 获取所有部门数据
+    with get_read_connection() as conn:
+        # 获取所有部门数据（从月度汇总表聚合，无需扫描销售明细）
         departments_df = pd.read_sql_query('''
-            SELECT DISTINCT 
+            SELECT 
                 department,
-                COUNT(*) as record_count,
-                SUM(amount) as total_amount
-            FROM sales_records
-            WHERE department IS NOT NULL 
-                AND department != ''
+                SUM(transaction_count) as record_count,
+                SUM(total_amount) as total_amount
+            FROM sales_monthly_summary
+            WHERE department != ''
             GROUP BY department
             HAVING record_count > 0
             ORDER BY total_amount DESC
-        ''', conn)
+        ''', conn, dtype={'record_count': 'int64', 'total_amount': 'float64'})
         
         return departments_df
 
 @st.cache_data(ttl=300)
-def get_department_customers(department):
-    """获取指定部门下的所有客户"""
-    with get_connection() as conn:
+def load_department_customers(data_version=None):
+    """一次加载所有部门的客户列表，按部门存入字典，切换部门时直接查字典"""
+    with get_read_connection() as conn:
         customers_df = pd.read_sql_query('''
-            SELECT DISTINCT 
+            SELECT 
+                department,
                 customer_name,
                 finance_id,
                 COUNT(*) as record_count,
                 SUM(amount) as total_amount
             FROM sales_records
-            WHERE department = ?
+            WHERE department IS NOT NULL 
+                AND department != ''
                 AND customer_name IS NOT NULL 
                 AND finance_id IS NOT NULL
-            GROUP BY customer_name, finance_id
-            HAVING record_count > 0
-            ORDER BY total_amount DESC
-        ''', conn, params=[department])
-        
-        return customers_df
+            GROUP BY department, customer_name, finance_id
+            ORDER BY department, total_amount DESC
+        ''', conn, dtype={'record_count': 'int64', 'total_amount': 'float64'})
+    
+    return {
+        department: group.drop(columns='department').reset_index(drop=True)
+        for department, group in customers_df.groupby('department', sort=False)
+    }
+
+def get_department_customers(department, data_version=None):
+    """获取指定部门下的所有客户"""
+    return load_department_customers(data_version=data_version).get(department, pd.DataFrame())
 
 @st.cache_data(ttl=300)
-def get_customer_products_analysis(finance_id, department):
-    """获取客户所有产品的分析数据（按部门）- 处理颜色为空的情况"""
-    with get_connection() as conn:
+def load_customer_product_months(finance_id, department, data_version=None):
+    """一次查询客户在部门内各产品的月度汇总，产品汇总和价格趋势都由此得出（颜色为空统一为""）"""
+    with get_read_connection() as conn:
         query = '''
             SELECT 
                 product_name,
                 COALESCE(color, '') as color,
+                date(record_date, 'start of month') as month,
                 COUNT(*) as transaction_count,
                 SUM(quantity) as total_quantity,
                 SUM(amount) as total_amount,
-                AVG(unit_price) as avg_price,
-                MIN(record_date) as first_date,
-                MAX(record_date) as last_date
+                SUM(unit_price) as price_sum,
+                COUNT(unit_price) as price_count,
+                strftime('%Y-%m-%d', MIN(record_date)) as first_date,
+                strftime('%Y-%m-%d', MAX(record_date)) as last_date
             FROM sales_records 
             WHERE finance_id = ? 
                 AND department = ?
                 AND product_name IS NOT NULL 
                 AND product_name != ''
-            GROUP BY product_name, COALESCE(color, '')
-            ORDER BY total_amount DESC
+            GROUP BY product_name, COALESCE(color, ''), date(record_date, 'start of month')
+            ORDER BY month
         '''
-        products_data = pd.read_sql_query(query, conn, params=[finance_id, department])
-    return products_data
+        monthly_data = pd.read_sql_query(
+            query, conn, params=[finance_id, department], dtype=AGGREGATE_DTYPES, parse_dates=['month']
+        )
+    return monthly_data
 
-def get_product_price_trend(finance_id, product_name, color, department):
-    """获取单个产品的价格趋势（按部门）- 处理颜色为空的情况"""
-    with get_connection() as conn:
-        # 处理颜色条件：如果颜色是""，则查询color IS NULL或空字符串
-        if color == '':
-            query = '''
-                SELECT 
-                    strftime('%Y-%m', record_date) as month,
-                    AVG(unit_price) as avg_price,
-                    SUM(quantity) as total_quantity,
-                    SUM(amount) as total_amount,
-                    COUNT(*) as transaction_count
-                FROM sales_records
-                WHERE finance_id = ? 
-                    AND product_name = ? 
-                    AND (color IS NULL OR color = '')
-                    AND department = ?
-                GROUP BY strftime('%Y-%m', record_date) 
-                ORDER BY month
-            '''
-            params = [finance_id, product_name, department]
-        else:
-            query = '''
-                SELECT 
-                    strftime('%Y-%m', record_date) as month,
-                    AVG(unit_price) as avg_price,
-                    SUM(quantity) as total_quantity,
-                    SUM(amount) as total_amount,
-                    COUNT(*) as transaction_count
-                FROM sales_records
-                WHERE finance_id = ? 
-                    AND product_name = ? 
-                    AND color = ?
-                    AND department = ?
-                GROUP BY strftime('%Y-%m', record_date) 
-                ORDER BY month
-            '''
-            params = [finance_id, product_name, color, department]
-        
-        trend_data = pd.read_sql_query(query, conn, params=params)
-    return trend_data
+@st.cache_data(ttl=300)
+def get_customer_products_analysis(finance_id, department, data_version=None):
+    """获取客户所有产品的分析数据（按部门）- 由月度汇总再聚合，不单独查询"""
+    monthly_data = load_customer_product_months(finance_id, department, data_version=data_version)
+    products_data = monthly_data.groupby(['product_name', 'color'], sort=False).agg(
+        transaction_count=('transaction_count', 'sum'),
+        total_quantity=('total_quantity', 'sum'),
+        total_amount=('total_amount', 'sum'),
+        price_sum=('price_sum', 'sum'),
+        price_count=('price_count', 'sum'),
+        first_date=('first_date', 'min'),
+        last_date=('last_date', 'max')
+    ).reset_index()
+    products_data.insert(5, 'avg_price', products_data['price_sum'] / products_data['price_count'].replace(0, np.nan))
+    products_data = products_data.drop(columns=['price_sum', 'price_count'])
+    return products_data.sort_values('total_amount', ascending=False, kind='stable').reset_index(drop=True)
+
+def get_product_price_trend(finance_id, product_name, color, department, data_version=None):
+    """获取单个产品的价格趋势（按部门）- 从缓存的月度汇总中按产品和颜色筛选"""
+    monthly_data = load_customer_product_months(finance_id, department, data_version=data_version)
+    product_months = monthly_data[
+        (monthly_data['product_name'] == product_name) & (monthly_data['color'] == color)
+    ]
+    return pd.DataFrame({
+        'month': product_months['month'],
+        'avg_price': product_months['price_sum'] / product_months['price_count'].replace(0, np.nan),
+        'total_quantity': product_months['total_quantity'],
+        'total_amount': product_months['total_amount'],
+        'transaction_count': product_months['transaction_count']
+    }).reset_index(drop=True)
 
-def get_complete_sales_records(finance_id, department, product_name=None, color=None):
+@st.cache_data(ttl=300, show_spinner=False)
+def get_complete_sales_records(finance_id, department, product_name=None, color=None, data_version=None):
     """获取完整的销售数据列表（按部门）- 处理颜色为空的情况"""
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         if product_name:
             if color == '':
                 query = '''
@@ -210,243 +236,83 @@ def get_complete_sales_records(finance_id, department, product_name=None, color=
         
         query += " ORDER BY record_date DESC"
         
-        transactions = pd.read_sql_query(query, conn, params=params)
+        # 明细行数最多，使用 Arrow 后端存储字符串列，内存占用更小，展示和导出时也无需再转换
+        transactions = pd.read_sql_query(query, conn, params=params, dtype=RECORD_DTYPES, dtype_backend='pyarrow')
     return transactions
 
-# 加载部门数据
-departments_df = load_base_data()
-
-if departments_df.empty:
-    st.warning("⚠️ 请先导入数据")
-    st.stop()
-
-# 创建两个选择框的布局 - 先选部门，再选客户
-st.markdown("### 🔍 选择部门与客户")
-
-col1, col2 = st.columns(2)
-
-with col1:
-    # 部门选择框
-    if not departments_df.empty:
-        # 创建部门选择选项
-        department_options = []
-        for _, row in departments_df.iterrows():
-            dept_name = row['department']
-            record_count = row['record_count']
-            total_amount = row['total_amount']
-            
-            # 格式化显示
-            if total_amount > 0:
-                display_text = f"{dept_name} ({record_count:,}条记录, ¥{total_amount:,.2f})"
-            else:
-                display_text = f"{dept_name} ({record_count:,}条记录)"
-            
-            department_options.append({
-                'display': display_text,
-                'department': dept_name,
-                'record_count': record_count,
-                'total_amount': total_amount
-            })
-    
-    # 按部门名称排序
-    department_options = sorted(department_options, key=lambda x: x['department'])
-    
-    # 创建下拉框
-    selected_dept_display = st.selectbox(
-        "选择部门",
-        [opt['display'] for opt in department_options],
-        help="选择要分析的部门，显示该部门的记录数和总金额"
-    )
-    
-    # 获取选中的部门信息
-    selected_department = None
-    for opt in department_options:
-        if opt['display'] == selected_dept_display:
-            selected_department = opt
-            break
-
-with col2:
-    # 客户选择框 - 根据选择的部门动态加载
-    if selected_department:
-        # 获取该部门下的客户
-        with st.spinner(f"正在加载 {selected_department['department']} 部门的客户列表..."):
-            customers_df = get_department_customers(selected_department['department'])
-        
-        if not customers_df.empty:
-            # 创建客户选择选项
-            customer_options = []
-            for _, row in customers_df.iterrows():
-                if row['record_count'] > 0:
-                    display_text = f"{row['customer_name']} ({row['finance_id']}) - {row['record_count']}笔订单"
-                else:
-                    display_text = f"{row['customer_name']} ({row['finance_id']})"
-                
-                customer_options.append({
-                    'display': display_text,
-                    'customer_name': row['customer_name'],
-                    'finance_id': row['finance_id'],
-                    'record_count': row['record_count'],
-                    'total_amount': row['total_amount']
-                })
-            
-            # 按客户名称排序
-            customer_options = sorted(customer_options, key=lambda x: x['customer_name'])
-            
-            # 创建下拉框
-            selected_customer_display = st.selectbox(
-                "选择客户",
-                [opt['display'] for opt in customer_options],
-                help=f"选择 {selected_department['department']} 部门的客户进行分析"
+@st.cache_resource(ttl=300, max_entries=100, show_spinner=False)
+def build_price_trend_figure(chart_data, chart_title):
+    """构建价格趋势图（按对象缓存、不经序列化，数据不变时重跑无需重新构建和校验轨迹；调用方不得修改返回的图表）"""
+    # 轨迹与布局在构造时一次性传入，避免逐条 add_trace / update_layout
+    return go.Figure(
+        data=[
+            # 价格趋势线
+            go.Scatter(
+                x=chart_data['month'], 
+                y=chart_data['avg_price'],
+                mode='lines+markers',
+                name='平均价格',
+                line=dict(color='#1f77b4', width=3, shape='spline', smoothing=0.8),
+                marker=dict(size=6),
+                hovertemplate='<b>%{x|%Y-%m}</b><br>价格: ¥%{y:.2f}<extra></extra>'
+            ),
+            # 交易数量柱状图（次坐标轴）
+            go.Bar(
+                x=chart_data['month'],
+                y=chart_data['transaction_count'],
+                name='交易次数',
+                yaxis='y2',
+                marker_color='rgba(255, 127, 14, 0.6)',
+                hovertemplate='<b>%{x|%Y-%m}</b><br>交易次数: %{y}<extra></extra>'
+            )
+        ],
+        layout=dict(
+            title=chart_title,
+            yaxis=dict(
+                title='价格 (元)',
+                showgrid=True,
+                gridcolor='rgba(128, 128, 128, 0.1)',
+                gridwidth=1
+            ),
+            yaxis2=dict(
+                title='交易次数',
+                overlaying='y',
+                side='right',
+                showgrid=False
+            ),
+            xaxis=dict(
+                title='月份',
+                showgrid=True,
+                gridcolor='rgba(128, 128, 128, 0.1)',
+                gridwidth=1
+            ),
+            hovermode='x unified',
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
             )
-            
-            # 获取选中的客户信息
-            selected_customer = None
-            for opt in customer_options:
-                if opt['display'] == selected_customer_display:
-                    selected_customer = opt
-                    break
-        else:
-            st.warning(f"⚠️ {selected_department['department']} 部门暂无客户数据")
-            selected_customer = None
-    else:
-        selected_customer = None
-        st.selectbox(
-            "选择客户",
-            ["请先选择部门"],
-            help="请先选择部门"
         )
+    )
 
-# 如果部门和客户都已选择，开始分析
-if selected_department and selected_customer:
-    department_name = selected_department['department']
-    customer_name = selected_customer['customer_name']
-    finance_id = selected_customer['finance_id']
-    
-    # 显示当前选择的信息
-    st.success(f"**已选择**: {department_name}部门 - {customer_name} ({finance_id})")
-    
-    # 获取该客户在选定部门的所有产品分析数据
-    with st.spinner(f"正在获取 {customer_name} 在 {department_name} 部门的产品数据..."):
-        products_analysis = get_customer_products_analysis(finance_id, department_name)
-    
-    if products_analysis.empty:
-        # 尝试更宽松的查询，检查是否有数据
-        with get_connection() as conn:
-            # 检查是否有该客户在该部门的任何记录
-            record_check = pd.read_sql_query('''
-                SELECT COUNT(*) as record_count
-                FROM sales_records
-                WHERE finance_id = ? 
-                    AND department = ?
-                    AND customer_name = ?
-            ''', conn, params=[finance_id, department_name, customer_name])
-            
-            if record_check.iloc[0]['record_count'] > 0:
-                # 有记录但没有产品数据，可能是产品名称为空
-                st.warning(f"⚠️ 该客户在 {department_name} 部门有 {record_check.iloc[0]['record_count']} 条记录，但产品数据不完整")
-            else:
-                st.error(f"❌ 错误：找不到 {customer_name} 在 {department_name} 部门的记录")
-        
-        st.stop()
-    
-    # 显示客户部门信息汇总
-    st.subheader(f"📊 {customer_name} - {department_name}部门 产品购买汇总")
-    
-    # 总体统计
-    total_products = len(products_analysis)
-    total_amount = products_analysis['total_amount'].sum()
-    total_quantity = products_analysis['total_quantity'].sum()
-    avg_price = products_analysis['avg_price'].mean() if not products_analysis.empty else 0
-    
-    col_stat1, col_stat2, col_stat3, col_stat4, col_stat5 = st.columns(5)
-    with col_stat1:
-        st.metric("产品种类", f"{total_products}种")
-    with col_stat2:
-        st.metric("总销售额", f"¥{total_amount:,.2f}")
-    with col_stat3:
-        st.metric("总销量", f"{total_quantity:,.0f}")
-    with col_stat4:
-        st.metric("平均单价", f"¥{avg_price:.2f}")
-    with col_stat5:
-        st.metric("所属部门", department_name)
-    
-    # 产品汇总表格
-    st.markdown("### 📋 产品汇总")
-    
-    # 格式化显示数据
-    display_data = products_analysis.copy()
-    
-    # 检查数据完整性
-    if display_data.empty:
-        st.warning("没有产品数据")
-        st.stop()
-    
-    display_data = display_data.rename(columns={
-        'product_name': '产品名称',
-        'color': '颜色',
-        'transaction_count': '交易次数',
-        'total_quantity': '总销量',
-        'total_amount': '总销售额',
-        'avg_price': '平均价格',
-        'first_date': '首次购买',
-        'last_date': '最近购买'
-    })
-    
-    # 确保数值类型正确
-    try:
-        display_data['总销售额'] = pd.to_numeric(display_data['总销售额'], errors='coerce').round(2)
-        display_data['平均价格'] = pd.to_numeric(display_data['平均价格'], errors='coerce').round(2)
-        display_data['总销量'] = pd.to_numeric(display_data['总销量'], errors='coerce').astype(int)
-        display_data['交易次数'] = pd.to_numeric(display_data['交易次数'], errors='coerce').astype(int)
-    except Exception as e:
-        st.error(f"数据处理错误: {str(e)}")
-        st.write("原始数据:", display_data)
-        st.stop()
-    
-    # 格式化日期
-    if '首次购买' in display_data.columns:
-        try:
-            display_data['首次购买'] = pd.to_datetime(display_data['首次购买']).dt.strftime('%Y-%m-%d')
-        except:
-            pass
-    
-    if '最近购买' in display_data.columns:
-        try:
-            display_data['最近购买'] = pd.to_datetime(display_data['最近购买']).dt.strftime('%Y-%m-%d')
-        except:
-            pass
-    
-    # 设置列宽配置
-    column_config = {
-        '产品名称': st.column_config.TextColumn(width="small"),
-        '颜色': st.column_config.TextColumn(width="small"),
-        '交易次数': st.column_config.NumberColumn(format="%d", width="small"),
-        '总销量': st.column_config.NumberColumn(format="%d", width="small"),
-        '总销售额': st.column_config.NumberColumn(format="¥%.2f", width="small"),
-        '平均价格': st.column_config.NumberColumn(format="¥%.2f", width="small"),
-        '首次购买': st.column_config.TextColumn(width="small"),
-        '最近购买': st.column_config.TextColumn(width="small")
-    }
-    
-    st.dataframe(display_data, width='stretch', height='auto', hide_index=True, column_config=column_config)
-    
+@st.fragment
+def render_product_detail(finance_id, customer_name, department_name, products_analysis):
+    """产品详细分析：切换产品时只重跑本片段，不重新加载部门、客户和产品汇总"""
     # 产品选择详细分析
     st.markdown("### 🔍 产品详细分析")
     
     # 创建产品选择选项
-    product_options = []
-    for _, row in products_analysis.iterrows():
-        product_name = str(row['product_name']) if pd.notna(row['product_name']) else "未命名产品"
-        color = str(row['color']) if pd.notna(row['color']) else ""
-        avg_price = float(row['avg_price']) if pd.notna(row['avg_price']) else 0
-        
-        # 如果有颜色信息且不是空字符串，则显示颜色
-        if color and color != "" and color != "nan":
-            option_text = f"{product_name} - {color} (¥{avg_price:.2f})"
-        else:
-            option_text = f"{product_name} (¥{avg_price:.2f})"
-        
-        product_options.append((option_text, product_name, color, avg_price))
+    # 查询已排除空产品名并将空颜色统一为""，逐行只需格式化显示文本（itertuples 不为每行构造 Series）
+    product_rows = products_analysis[['product_name', 'color', 'avg_price']].fillna({'avg_price': 0})
+    product_options = [
+        (
+            f"{product_name} - {color} (¥{avg_price:.2f})" if color else f"{product_name} (¥{avg_price:.2f})",
+            product_name, color, avg_price
+        )
+        for product_name, color, avg_price in product_rows.itertuples(index=False, name=None)
+    ]
     
     # 添加"全部产品"选项
     if product_options:
@@ -459,24 +325,16 @@ if selected_department and selected_customer:
             help="选择产品和颜色查看详细订单信息，或选择'全部产品'查看所有订单"
         )
         
-        # 获取选中的产品
-        selected_product = None
-        selected_color = None
-        for option_text, product, color, price in product_options:
-            if option_text == selected_option:
-                selected_product = product
-                selected_color = color
-                break
-        
-        # 如果是"全部产品"，设置为None
-        if selected_option == "全部产品 - 查看所有订单":
-            selected_product = None
-            selected_color = None
+        # 获取选中的产品（"全部产品"选项对应的产品和颜色均为None）
+        product_map = {option_text: (product, color) for option_text, product, color, price in product_options}
+        selected_product, selected_color = product_map.get(selected_option, (None, None))
         
         # 获取完整的销售数据
         with st.spinner("正在获取订单数据..."):
             try:
-                complete_records = get_complete_sales_records(finance_id, department_name, selected_product, selected_color)
+                complete_records = get_complete_sales_records(
+                    finance_id, department_name, selected_product, selected_color, data_version=data_version
+                )
             except Exception as e:
                 st.error(f"获取订单数据失败: {str(e)}")
                 complete_records = pd.DataFrame()
@@ -490,8 +348,7 @@ if selected_department and selected_customer:
                 st.metric("总订单数", f"{total_records}笔")
                 
                 # 格式化完整销售数据
-                records_display = complete_records.copy()
-                records_display = records_display.rename(columns={
+                records_display = complete_records.rename(columns={
                     'customer_name': '客户名称',
                     'finance_id': '编号',
                     'sub_customer_name': '子客户名称',
@@ -517,7 +374,9 @@ if selected_department and selected_customer:
                 available_columns = [col for col in column_order if col in records_display.columns]
                 records_display = records_display[available_columns]
                 
-                st.dataframe(records_display, width='stretch', hide_index=True, height='auto', 
+                if len(records_display) > MAX_DISPLAY_ROWS:
+                    st.caption(f"仅显示最近 {MAX_DISPLAY_ROWS} 笔订单，完整记录请导出查看")
+                st.dataframe(records_display.head(MAX_DISPLAY_ROWS), width='stretch', hide_index=True, height='auto', 
                             column_config={
                                 '单价': st.column_config.NumberColumn(format="¥%.2f", width='small'),
                                 '金额': st.column_config.NumberColumn(format="¥%.2f", width='small'),
@@ -526,12 +385,12 @@ if selected_department and selected_customer:
                 
                 # 导出功能
                 st.markdown("### 📤 导出数据")
-                csv_data = records_display.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
+                # 仅在点击下载时才序列化CSV，普通重跑不再生成导出数据
                 st.download_button(
                     "📥 导出所有订单记录",
-                    csv_data,
-                    f"{customer_name}_{department_name}_所有订单记录.csv",
-                    "text/csv",
+                    data=lambda: get_csv_bytes(records_display),
+                    file_name=f"{customer_name}_{department_name}_所有订单记录.csv",
+                    mime="text/csv",
                     width='stretch'
                 )
             else:
@@ -547,21 +406,16 @@ if selected_department and selected_customer:
             else:
                 st.subheader(f"📋 {selected_product} 订单详情 ({department_name}部门)")
             
-            # 找到对应的产品信息
-            product_info = None
-            for _, row in products_analysis.iterrows():
-                # 修复产品匹配逻辑：正确处理颜色为空的情况
-                if row['product_name'] == selected_product:
-                    # 检查颜色是否匹配
-                    row_color = str(row['color']) if pd.notna(row['color']) else ""
-                    if (selected_color == "" and row_color == "") or (selected_color == row_color):
-                        product_info = row
-                        break
+            # 找到对应的产品信息（颜色为空已在查询中统一为""，按产品+颜色索引直接定位）
+            products_indexed = products_analysis.set_index(['product_name', 'color'])
+            product_key = (selected_product, selected_color)
+            product_info = products_indexed.loc[product_key] if product_key in products_indexed.index else None
             
             if product_info is not None:
-                # 获取价格趋势数据
-                with st.spinner("正在获取价格趋势..."):
-                    trend_data = get_product_price_trend(finance_id, selected_product, selected_color, department_name)
+                # 获取价格趋势数据（从已缓存的月度汇总中筛选，无需再次查询）
+                trend_data = get_product_price_trend(
+                    finance_id, selected_product, selected_color, department_name, data_version=data_version
+                )
                 
                 # 产品关键指标
                 col_metrics1, col_metrics2, col_metrics3, col_metrics4, col_metrics5 = st.columns(5)
@@ -581,72 +435,15 @@ if selected_department and selected_customer:
                     st.markdown("### 📈 价格趋势")
                     
                     try:
-                        # 处理趋势数据
-                        trend_data['month'] = pd.to_datetime(trend_data['month'] + '-01', format='%Y-%m-%d')
-                        trend_data = trend_data.sort_values('month')
-                        
-                        # 创建多图表布局
-                        fig = go.Figure()
-                        
-                        # 价格趋势线
-                        fig.add_trace(go.Scatter(
-                            x=trend_data['month'], 
-                            y=trend_data['avg_price'],
-                            mode='lines+markers',
-                            name='平均价格',
-                            line=dict(color='#1f77b4', width=3, shape='spline', smoothing=0.8),
-                            marker=dict(size=6),
-                            hovertemplate='<b>%{x|%Y-%m}</b><br>价格: ¥%{y:.2f}<extra></extra>'
-                        ))
+                        # 月度汇总查询已按月份排序，筛选单个产品后顺序不变，无需再排序
                         
-                        # 添加交易数量柱状图（次坐标轴）
-                        fig.add_trace(go.Bar(
-                            x=trend_data['month'],
-                            y=trend_data['transaction_count'],
-                            name='交易次数',
-                            yaxis='y2',
-                            marker_color='rgba(255, 127, 14, 0.6)',
-                            hovertemplate='<b>%{x|%Y-%m}</b><br>交易次数: %{y}<extra></extra>'
-                        ))
-                        
-                        # 优化图表布局
                         if selected_color and selected_color != "" and selected_color != "nan":
                             chart_title = f'{selected_product} - {selected_color} 价格趋势 ({department_name}部门)'
                         else:
                             chart_title = f'{selected_product} 价格趋势 ({department_name}部门)'
                         
-                        fig.update_layout(
-                            title=chart_title,
-                            xaxis_title='月份',
-                            yaxis_title='价格 (元)',
-                            yaxis=dict(
-                                title='价格 (元)',
-                                showgrid=True,
-                                gridcolor='rgba(128, 128, 128, 0.1)',
-                                gridwidth=1
-                            ),
-                            yaxis2=dict(
-                                title='交易次数',
-                                overlaying='y',
-                                side='right',
-                                showgrid=False
-                            ),
-                            xaxis=dict(
-                                showgrid=True,
-                                gridcolor='rgba(128, 128, 128, 0.1)',
-                                gridwidth=1
-                            ),
-                            hovermode='x unified',
-                            legend=dict(
-                                orientation="h",
-                                yanchor="bottom",
-                                y=1.02,
-                                xanchor="right",
-                                x=1
-                            )
-                        )
-                        
-                        st.plotly_chart(fig, width='stretch', use_container_width=True)
+                        fig = build_price_trend_figure(trend_data, chart_title)
+                        st.plotly_chart(fig, width='stretch', key="price_trend_chart")
                         
                         # 添加价格统计信息
                         st.markdown("#### 📊 价格统计")
@@ -679,8 +476,7 @@ if selected_department and selected_customer:
                 
                 if not complete_records.empty:
                     # 格式化完整销售数据
-                    records_display = complete_records.copy()
-                    records_display = records_display.rename(columns={
+                    records_display = complete_records.rename(columns={
                         'customer_name': '客户名称',
                         'finance_id': '编号',
                         'sub_customer_name': '子客户名称',
@@ -700,7 +496,7 @@ if selected_department and selected_customer:
                     })
                     
                     # 处理颜色显示
-                    records_display['颜色'] = records_display['颜色'].apply(lambda x: '' if pd.isna(x) or x == '' else x)
+                    records_display['颜色'] = records_display['颜色'].fillna('')
                     
                     # 重新排序列顺序
                     column_order = ['客户名称', '编号', '子客户名称', '部门', '年', '月', '日', 
@@ -709,7 +505,9 @@ if selected_department and selected_customer:
                     available_columns = [col for col in column_order if col in records_display.columns]
                     records_display = records_display[available_columns]
                     
-                    st.dataframe(records_display, width='stretch', height='auto',
+                    if len(records_display) > MAX_DISPLAY_ROWS:
+                        st.caption(f"仅显示最近 {MAX_DISPLAY_ROWS} 笔订单，完整记录请导出查看")
+                    st.dataframe(records_display.head(MAX_DISPLAY_ROWS), width='stretch', height='auto',
                                 column_config={
                                     '单价': st.column_config.NumberColumn(format="¥%.2f", width='small'),
                                     '金额': st.column_config.NumberColumn(format="¥%.2f", width='small'),
@@ -718,12 +516,12 @@ if selected_department and selected_customer:
                     
                     # 导出功能
                     st.markdown("### 📤 导出数据")
-                    csv_data = records_display.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
+                    # 仅在点击下载时才序列化CSV，普通重跑不再生成导出数据
                     st.download_button(
                         "📥 导出订单记录",
-                        csv_data,
-                        f"{customer_name}_{selected_product}_{department_name}_订单记录.csv",
-                        "text/csv",
+                        data=lambda: get_csv_bytes(records_display),
+                        file_name=f"{customer_name}_{selected_product}_{department_name}_订单记录.csv",
+                        mime="text/csv",
                         width='stretch'
                     )
                 else:
@@ -733,6 +531,202 @@ if selected_department and selected_customer:
     else:
         st.info("没有可供选择的产品")
 
+# 加载部门数据
+departments_df = load_base_data(data_version=data_version)
+
+if departments_df.empty:
+    st.warning("⚠️ 请先导入数据")
+    st.stop()
+
+# 创建两个选择框的布局 - 先选部门，再选客户
+st.markdown("### 🔍 选择部门与客户")
+
+col1, col2 = st.columns(2)
+
+with col1:
+    # 部门选择框
+    if not departments_df.empty:
+        # 创建部门选择选项
+        department_options = []
+        for _, row in departments_df.iterrows():
+            dept_name = row['department']
+            record_count = row['record_count']
+            total_amount = row['total_amount']
+            
+            # 格式化显示
+            if total_amount > 0:
+                display_text = f"{dept_name} ({record_count:,}条记录, ¥{total_amount:,.2f})"
+            else:
+                display_text = f"{dept_name} ({record_count:,}条记录)"
+            
+            department_options.append({
+                'display': display_text,
+                'department': dept_name,
+                'record_count': record_count,
+                'total_amount': total_amount
+            })
+    
+    # 按部门名称排序
+    department_options = sorted(department_options, key=lambda x: x['department'])
+    
+    # 创建下拉框
+    selected_dept_display = st.selectbox(
+        "选择部门",
+        [opt['display'] for opt in department_options],
+        help="选择要分析的部门，显示该部门的记录数和总金额"
+    )
+    
+    # 获取选中的部门信息
+    department_map = {opt['display']: opt for opt in department_options}
+    selected_department = department_map.get(selected_dept_display)
+
+with col2:
+    # 客户选择框 - 根据选择的部门动态加载
+    if selected_department:
+        # 获取该部门下的客户
+        with st.spinner(f"正在加载 {selected_department['department']} 部门的客户列表..."):
+            customers_df = get_department_customers(selected_department['department'], data_version=data_version)
+        
+        if not customers_df.empty:
+            # 创建客户选择选项（按客户名称排序，整列拼接显示文本，无需逐行遍历）
+            customers_sorted = customers_df.sort_values('customer_name', kind='stable')
+            display_text = (
+                customers_sorted['customer_name'].astype(str) + ' ('
+                + customers_sorted['finance_id'].astype(str) + ')'
+            )
+            display_text = display_text.where(
+                customers_sorted['record_count'] <= 0,
+                display_text + ' - ' + customers_sorted['record_count'].astype(str) + '笔订单'
+            )
+            customer_options = customers_sorted.assign(display=display_text)[
+                ['display', 'customer_name', 'finance_id', 'record_count', 'total_amount']
+            ].to_dict('records')
+            
+            # 创建下拉框
+            selected_customer_display = st.selectbox(
+                "选择客户",
+                [opt['display'] for opt in customer_options],
+                help=f"选择 {selected_department['department']} 部门的客户进行分析"
+            )
+            
+            # 获取选中的客户信息
+            customer_map = {opt['display']: opt for opt in customer_options}
+            selected_customer = customer_map.get(selected_customer_display)
+        else:
+            st.warning(f"⚠️ {selected_department['department']} 部门暂无客户数据")
+            selected_customer = None
+    else:
+        selected_customer = None
+        st.selectbox(
+            "选择客户",
+            ["请先选择部门"],
+            help="请先选择部门"
+        )
+
+# 如果部门和客户都已选择，开始分析
+if selected_department and selected_customer:
+    department_name = selected_department['department']
+    customer_name = selected_customer['customer_name']
+    finance_id = selected_customer['finance_id']
+    
+    # 显示当前选择的信息
+    st.success(f"**已选择**: {department_name}部门 - {customer_name} ({finance_id})")
+    
+    # 获取该客户在选定部门的所有产品分析数据
+    with st.spinner(f"正在获取 {customer_name} 在 {department_name} 部门的产品数据..."):
+        products_analysis = get_customer_products_analysis(finance_id, department_name, data_version=data_version)
+    
+    if products_analysis.empty:
+        # 尝试更宽松的查询，检查是否有数据
+        with get_read_connection() as conn:
+            # 检查是否有该客户在该部门的任何记录
+            record_check = pd.read_sql_query('''
+                SELECT COUNT(*) as record_count
+                FROM sales_records
+                WHERE finance_id = ? 
+                    AND department = ?
+                    AND customer_name = ?
+            ''', conn, params=[finance_id, department_name, customer_name])
+            
+            if record_check.iloc[0]['record_count'] > 0:
+                # 有记录但没有产品数据，可能是产品名称为空
+                st.warning(f"⚠️ 该客户在 {department_name} 部门有 {record_check.iloc[0]['record_count']} 条记录，但产品数据不完整")
+            else:
+                st.error(f"❌ 错误：找不到 {customer_name} 在 {department_name} 部门的记录")
+        
+        st.stop()
+    
+    # 显示客户部门信息汇总
+    st.subheader(f"📊 {customer_name} - {department_name}部门 产品购买汇总")
+    
+    # 总体统计
+    total_products = len(products_analysis)
+    total_amount = products_analysis['total_amount'].sum()
+    total_quantity = products_analysis['total_quantity'].sum()
+    avg_price = products_analysis['avg_price'].mean() if not products_analysis.empty else 0
+    
+    col_stat1, col_stat2, col_stat3, col_stat4, col_stat5 = st.columns(5)
+    with col_stat1:
+        st.metric("产品种类", f"{total_products}种")
+    with col_stat2:
+        st.metric("总销售额", f"¥{total_amount:,.2f}")
+    with col_stat3:
+        st.metric("总销量", f"{total_quantity:,.0f}")
+    with col_stat4:
+        st.metric("平均单价", f"¥{avg_price:.2f}")
+    with col_stat5:
+        st.metric("所属部门", department_name)
+    
+    # 产品汇总表格
+    st.markdown("### 📋 产品汇总")
+    
+    # 检查数据完整性
+    if products_analysis.empty:
+        st.warning("没有产品数据")
+        st.stop()
+    
+    # 格式化显示数据（重命名时不复制底层数据，后续只整列替换）
+    display_data = products_analysis.rename(copy=False, columns={
+        'product_name': '产品名称',
+        'color': '颜色',
+        'transaction_count': '交易次数',
+        'total_quantity': '总销量',
+        'total_amount': '总销售额',
+        'avg_price': '平均价格',
+        'first_date': '首次购买',
+        'last_date': '最近购买'
+    })
+    
+    # 确保数值类型正确
+    try:
+        display_data['总销售额'] = pd.to_numeric(display_data['总销售额'], errors='coerce')
+        display_data['平均价格'] = pd.to_numeric(display_data['平均价格'], errors='coerce')
+        display_data['总销量'] = pd.to_numeric(display_data['总销量'], errors='coerce').astype(int)
+        display_data['交易次数'] = pd.to_numeric(display_data['交易次数'], errors='coerce').astype(int)
+    except Exception as e:
+        st.error(f"数据处理错误: {str(e)}")
+        st.write("原始数据:", display_data)
+        st.stop()
+    
+    # 首次/最近购买日期已在查询中格式化为 YYYY-MM-DD，无需再解析
+    
+    # 设置列宽配置
+    column_config = {
+        '产品名称': st.column_config.TextColumn(width="small"),
+        '颜色': st.column_config.TextColumn(width="small"),
+        '交易次数': st.column_config.NumberColumn(format="%d", width="small"),
+        '总销量': st.column_config.NumberColumn(format="%d", width="small"),
+        '总销售额': st.column_config.NumberColumn(format="¥%.2f", width="small"),
+        '平均价格': st.column_config.NumberColumn(format="¥%.2f", width="small"),
+        '首次购买': st.column_config.TextColumn(width="small"),
+        '最近购买': st.column_config.TextColumn(width="small")
+    }
+    
+    st.dataframe(display_data, width='stretch', height='auto', hide_index=True, column_config=column_config)
+    
+    # 产品详细分析（片段内切换产品只重跑该区域）
+    render_product_detail(finance_id, customer_name, department_name, products_analysis)
+
 # 使用说明
 with st.expander("💡 使用说明", expanded=False):
     st.markdown("""
@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from core.database import get_connection, get_database_status
+from core.database import get_connection, get_read_connection, get_database_status
 from datetime import datetime, timedelta
 from utils.auth import require_login, check_permission
 
@@ -21,7 +21,7 @@ if not check_permission('admin'):
 
 # 获取客户数据的函数
 def load_customer_data():
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         df = pd.read_sql_query('''
             SELECT 
                 c.id,
@@ -42,9 +42,8 @@ def load_customer_data():
         ''', conn)
         
         # 处理空值
-        df['区域'] = df['区域'].fillna('')
-        df['联系人'] = df['联系人'].fillna('')
-        df['电话'] = df['电话'].fillna('')
+        text_columns = ['区域', '联系人', '电话']
+        df[text_columns] = df[text_columns].fillna('')
         df['最近交易日期'] = df['最近交易日期'].fillna('无交易记录')
         
         return df
@@ -1,12 +1,11 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 from core.debt_service import DebtAnalysisService
 from core.customer_analysis import SalesDebtIntegrationService
 from utils.auth import require_login, check_permission
 from utils.data_processor import process_debt_excel_data, validate_debt_data, get_sample_data
+from utils.file_utils import dataframe_to_csv_bytes
 
 # -----------------------------------------------------------------------------
 # 1. 配置与常量定义
@@ -687,10 +686,9 @@ def render_review_analysis_tab(integration_service):
 
     # 导出功能
     if not df_display.empty:
-        csv = df_display[display_columns].to_csv(index=False, encoding='utf-8-sig')
         st.download_button(
             label="📥 导出当前数据",
-            data=csv,
+            data=lambda: dataframe_to_csv_bytes(df_display[display_columns]),
             file_name=f"客户信用分析_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
             mime="text/csv",
             width='stretch',
@@ -895,10 +893,9 @@ def render_customer_detail_view(integration_service):
                     
                     with col_export1:
                         if not customer_detail['sales_records'].empty:
-                            sales_csv = customer_detail['sales_records'].to_csv(index=False).encode('utf-8-sig')
                             st.download_button(
                                 label="📥 导出销售记录",
-                                data=sales_csv,
+                                data=lambda: dataframe_to_csv_bytes(customer_detail['sales_records']),
                                 file_name=f"{display_name}_销售记录_{datetime.now().strftime('%Y%m%d')}.csv",
                                 mime="text/csv",
                                 help="导出该客户的所有销售记录"
@@ -906,10 +903,9 @@ def render_customer_detail_view(integration_service):
                     
                     with col_export2:
                         if not customer_detail['debt_records'].empty:
-                            debt_csv = customer_detail['debt_records'].to_csv(index=False).encode('utf-8-sig')
                             st.download_button(
                                 label="📥 导出欠款记录",
-                                data=debt_csv,
+                                data=lambda: dataframe_to_csv_bytes(customer_detail['debt_records']),
                                 file_name=f"{display_name}_欠款记录_{datetime.now().strftime('%Y%m%d')}.csv",
                                 mime="text/csv",
                                 help="导出该客户的所有欠款记录"
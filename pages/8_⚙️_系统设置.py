@@ -8,10 +8,13 @@ from core.database import (
     optimize_database,
     clear_database,
     init_database,
-    get_connection
+    get_connection,
+    get_data_version,
+    restore_database
 )
 from core.analysis_service import AnalysisService
 import shutil
+import tempfile
 
 # -------------------------------
 # 页面配置与初始化
@@ -20,7 +23,15 @@ st.set_page_config(page_title="系统设置", layout="wide")
 st.logo(image="./assets/logo.png", icon_image="./assets/logo.png")
 st.title("⚙️ 系统设置")
 
-analysis_service = AnalysisService()
+@st.cache_resource
+def get_analysis_service():
+    """全局共享的分析服务实例"""
+    return AnalysisService()
+
+@st.cache_data(ttl=300)
+def get_cached_statistics(data_version=None):
+    """缓存统计信息（data_version 变化时重新计算）"""
+    return get_analysis_service().get_statistics()
 
 # -------------------------------
 # 系统信息
@@ -98,6 +109,7 @@ with col3:
     if st.button("🗑️ 清空所有数据", width='stretch', type="secondary"):
         if st.checkbox("确认清空所有数据？此操作不可恢复！", key="clear_confirm"):
             clear_database()
+            st.cache_data.clear()
             st.success("✅ 所有数据已清空")
             st.rerun()
 
@@ -109,7 +121,7 @@ st.divider()
 st.subheader("📈 数据统计概览")
 
 try:
-    stats = analysis_service.get_statistics()
+    stats = get_cached_statistics(data_version=get_data_version())
     if stats.get("total_records", 0) > 0:
         col1, col2, col3, col4, col5 = st.columns(5)
         col1.metric("主客户数", db_status["main_customers"])
@@ -186,8 +198,16 @@ uploaded_backup = st.file_uploader("上传备份文件进行恢复", type=["db"]
 if uploaded_backup is not None:
     if st.button("🔄 恢复数据库", type="secondary", width='stretch'):
         try:
-            with open("ceramic_prices.db", "wb") as f:
-                f.write(uploaded_backup.getbuffer())
+            # 先写入临时文件，再经 SQLite 备份接口恢复，不直接覆盖正在使用的数据库文件
+            with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp:
+                tmp.write(uploaded_backup.getbuffer())
+            try:
+                restore_database(tmp.name)
+            finally:
+                os.remove(tmp.name)
+            # 旧版本备份可能缺少月度汇总表和新增索引，恢复后补建
+            init_database()
+            st.cache_data.clear()
             st.success("✅ 数据库恢复成功")
             st.rerun()
         except Exception as e:
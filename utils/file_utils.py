@@ -4,6 +4,7 @@ import os
 from openpyxl import load_workbook
 from typing import Tuple, Dict, Any
 
+import io
 import os
 import pandas as pd
 import warnings
@@ -360,4 +361,11 @@ def get_column_mapping(headers: list) -> Dict[str, str]:
     for header in headers:
         standard_header = header.replace(' ', '')
         mapping[standard_header] = header
-    return mapping
\ No newline at end of file
+    return mapping
+
+def dataframe_to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """将DataFrame导出为带BOM的UTF-8 CSV字节（Excel可直接识别中文）"""
+    # 直接写入字节缓冲区并编码，省去先生成完整字符串再整体编码的一次复制
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8-sig')
+    return buffer.getvalue()